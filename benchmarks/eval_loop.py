@@ -0,0 +1,118 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+"""
+Micro-benchmark of the evaluator: runs a loop calling a namespace
+command and reports the per-iteration cost. No dispatcher connection
+is needed.
+
+Usage: python benchmarks/eval_loop.py [--iterations N] [--legacy-copy] [--no-compiler]
+
+--legacy-copy deep-copies every CommandCall before evaluating it, the
+way the evaluator used to, to compare against the current behaviour.
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from freenas.cli import repl
+from freenas.cli.namespace import Namespace, Command
+from freenas.cli.parser import parse, CommandCall
+from freenas.cli.output import ValueType
+
+
+class CounterCommand(Command):
+    def run(self, context, args, kwargs, opargs):
+        self.parent.counter += 1
+
+
+class BenchNamespace(Namespace):
+    def __init__(self, name):
+        super(BenchNamespace, self).__init__(name)
+        self.counter = 0
+
+    def commands(self):
+        cmd = CounterCommand()
+        cmd.parent = self
+        return {'bump': cmd}
+
+
+SCRIPT = '''
+for (i in range(0, {0})) {{
+    bench inner bump value=${{i}} name="item"
+}}
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--legacy-copy', action='store_true')
+    parser.add_argument('--no-compiler', action='store_true')
+    args = parser.parse_args()
+
+    context = repl.Context()
+    ml = repl.MainLoop(context)
+    context.ml = ml
+    context.variables.set('compiler', 'no' if args.no_compiler else 'yes', ValueType.BOOLEAN)
+
+    outer = BenchNamespace('bench')
+    inner = BenchNamespace('inner')
+    outer.register_namespace(inner)
+    context.root_ns.register_namespace(outer)
+
+    if args.legacy_copy:
+        orig_eval = ml.eval
+
+        def eval(token, **kwargs):
+            if isinstance(token, CommandCall) and not kwargs.get('cursor'):
+                token = copy.deepcopy(token)
+
+            return orig_eval(token, **kwargs)
+
+        ml.eval = eval
+
+    ast = parse(SCRIPT.format(args.iterations), '<benchmark>')
+    started_at = time.time()
+    ml.eval_block(ast)
+    elapsed = time.time() - started_at
+
+    assert inner.counter == args.iterations, 'command was called {0} times'.format(inner.counter)
+    print('{0} iterations in {1:.3f}s, {2:.1f}us per iteration'.format(
+        args.iterations,
+        elapsed,
+        elapsed / args.iterations * 1000000
+    ))
+
+
+if __name__ == '__main__':
+    main()
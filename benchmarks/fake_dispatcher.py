@@ -0,0 +1,300 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+"""
+In-process stand-in for the dispatcher. FakeDispatcher implements the
+parts of freenas.dispatcher.client.Client interface the CLI uses
+(connect, login, RPC calls, event handlers) on top of synthetic data,
+so benchmarks are reproducible offline and without a FreeNAS host.
+"""
+
+import uuid
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from freenas.utils.query import query
+
+
+class FakeDispatcher(object):
+    def __init__(self, scale=1000, task_duration=0.0, rpc_latency=0.0, seed=0):
+        self.scale = scale
+        self.task_duration = task_duration
+        self.rpc_latency = rpc_latency
+        self.random = random.Random(seed)
+        self.opened = False
+        self.token = None
+        self.event_callback = None
+        self.error_callback = None
+        self.event_handlers = {}
+        self.lock = threading.Lock()
+        self.rpc_calls = 0
+        self.collections = generate_collections(scale, self.random)
+
+    # Client interface
+    def connect(self, uri, password=None):
+        self.opened = True
+
+    def disconnect(self):
+        self.opened = False
+
+    def login_user(self, username, password, check_password=False):
+        self.token = uuid.uuid4().hex
+
+    def login_token(self, token):
+        self.token = token
+
+    def subscribe_events(self, *masks):
+        pass
+
+    def unsubscribe_events(self, *masks):
+        pass
+
+    def on_event(self, callback):
+        self.event_callback = callback
+
+    def on_error(self, callback):
+        self.error_callback = callback
+
+    def register_event_handler(self, name, handler):
+        self.event_handlers.setdefault(name, []).append(handler)
+        return handler
+
+    def unregister_event_handler(self, name, handler):
+        handlers = self.event_handlers.get(name, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def call_sync(self, name, *args, **kwargs):
+        self.rpc_calls += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+        service, __, method = name.rpartition('.')
+        if method == 'query':
+            filter = args[0] if len(args) > 0 else []
+            params = args[1] if len(args) > 1 else {}
+            return query(self.collections.get(service, []), *(filter or []), **(params or {}))
+
+        handler = getattr(self, 'rpc_' + name.replace('.', '_'), None)
+        if handler:
+            return handler(*args)
+
+        return None
+
+    def call_async(self, name, callback, *args, **kwargs):
+        def worker():
+            callback(self.call_sync(name, *args, **kwargs))
+
+        t = threading.Thread(target=worker, daemon=True)
+        t.start()
+        return t
+
+    def call_task_sync(self, name, *args):
+        tid = self.rpc_task_submit(name, list(args))
+        return self.call_sync('task.query', [('id', '=', tid)], {'single': True})
+
+    # RPC implementations
+    def rpc_management_enable_features(self, features):
+        pass
+
+    def rpc_management_ping(self):
+        return 'pong'
+
+    def rpc_session_get_my_session_id(self):
+        return 1
+
+    def rpc_session_whoami(self):
+        return 'root'
+
+    def rpc_shell_get_shells(self):
+        return ['/bin/sh', '/bin/csh', '/usr/local/bin/bash', '/usr/local/bin/zsh']
+
+    def rpc_volume_get_disks_allocation(self, disks):
+        return {i: {'type': 'VOLUME', 'name': 'tank'} for i in disks}
+
+    def rpc_task_submit(self, name, args):
+        with self.lock:
+            tasks = self.collections['task']
+            tid = max((t['id'] for t in tasks), default=0) + 1
+            task = make_task(tid, name, 'EXECUTING', datetime.utcnow(), session=1)
+            task['args'] = args
+            tasks.append(task)
+
+        self.emit_entity_event('task', 'create', [task])
+        threading.Thread(target=self.__finish_task, args=(task,), daemon=True).start()
+        return tid
+
+    def rpc_task_abort(self, tid):
+        task = query(self.collections['task'], ('id', '=', tid), single=True)
+        if task:
+            task['state'] = 'ABORTED'
+            self.emit_entity_event('task', 'update', [task])
+
+    def __finish_task(self, task):
+        if self.task_duration:
+            time.sleep(self.task_duration)
+
+        task = dict(task, state='FINISHED', finished_at=datetime.utcnow())
+        task['progress'] = {'percentage': 100, 'message': 'Finished'}
+        with self.lock:
+            tasks = self.collections['task']
+            tasks[:] = [task if t['id'] == task['id'] else t for t in tasks]
+
+        self.emit_entity_event('task', 'update', [task])
+
+    # Events
+    def emit_event(self, name, args):
+        for i in list(self.event_handlers.get(name, [])):
+            i(args)
+
+        if self.event_callback:
+            self.event_callback(name, args)
+
+    def emit_entity_event(self, collection, operation, entities):
+        self.emit_event('entity-subscriber.{0}.changed'.format(collection), {
+            'service': collection,
+            'operation': operation,
+            'ids': [i['id'] for i in entities],
+            'entities': entities
+        })
+
+
+def make_task(id, name, state, created_at, session=None):
+    return {
+        'id': id,
+        'name': name,
+        'state': state,
+        'parent': None,
+        'session': session,
+        'created_at': created_at,
+        'started_at': created_at,
+        'finished_at': created_at if state in ('FINISHED', 'FAILED') else None,
+        'description': {'message': 'Running {0}'.format(name)},
+        'progress': {'percentage': 0, 'message': 'Started'},
+        'warnings': [],
+        'error': None,
+        'result': None
+    }
+
+
+def generate_collections(scale, rand):
+    now = datetime.utcnow()
+    groups = [
+        {'id': 'group-{0}'.format(i), 'gid': 1000 + i, 'name': 'group{0}'.format(i), 'builtin': False, 'sudo': False}
+        for i in range(max(scale // 10, 1))
+    ]
+
+    users = [{
+        'id': 'user-{0}'.format(i),
+        'uid': 1000 + i,
+        'username': 'user{0}'.format(i),
+        'full_name': 'Benchmark User {0}'.format(i),
+        'email': 'user{0}@example.com'.format(i),
+        'group': rand.choice(groups)['id'],
+        'groups': [rand.choice(groups)['id'] for __ in range(3)],
+        'home': '/mnt/tank/home/user{0}'.format(i),
+        'shell': '/bin/sh',
+        'locked': False,
+        'sudo': False,
+        'builtin': False,
+        'password_disabled': False,
+        'sshpubkey': None,
+        'origin': {'domain': 'local'}
+    } for i in range(scale)]
+
+    disks = [{
+        'id': 'serial:BENCH{0:06d}'.format(i),
+        'name': 'ada{0}'.format(i),
+        'path': '/dev/ada{0}'.format(i),
+        'serial': 'BENCH{0:06d}'.format(i),
+        'mediasize': 4 * 1024 ** 4,
+        'online': True,
+        'status': {'description': 'Benchmark disk', 'empty': False},
+        'acoustic_level': 'DISABLED',
+        'apm_mode': None,
+        'standby_mode': None
+    } for i in range(max(scale // 10, 1))]
+
+    def zfs_props(used):
+        return {
+            'used': {'value': str(used), 'parsed': used},
+            'available': {'value': str(10 * used), 'parsed': 10 * used},
+            'compression': {'value': 'lz4', 'parsed': 'lz4'},
+            'readonly': {'value': 'off', 'parsed': False}
+        }
+
+    volumes = [{
+        'id': 'tank',
+        'name': 'tank',
+        'status': 'ONLINE',
+        'topology': {'data': [], 'log': [], 'cache': [], 'spare': []},
+        'properties': zfs_props(1024 ** 4)
+    }]
+
+    datasets = [{
+        'id': 'tank/ds{0}'.format(i),
+        'name': 'tank/ds{0}'.format(i),
+        'volume': 'tank',
+        'type': 'FILESYSTEM',
+        'permissions_type': 'PERM',
+        'permissions': {'user': 'root', 'group': 'wheel'},
+        'properties': zfs_props(rand.randint(1, 1024 ** 3))
+    } for i in range(scale)]
+
+    snapshots = [{
+        'id': '{0}@auto-{1}'.format(ds['id'], j),
+        'name': 'auto-{0}'.format(j),
+        'dataset': ds['id'],
+        'lifetime': 3600 * 24 * 7,
+        'replicable': True,
+        'properties': zfs_props(rand.randint(1, 1024 ** 2))
+    } for ds in datasets for j in range(2)]
+
+    tasks = [
+        make_task(i + 1, 'volume.snapshot.create', 'FINISHED', now - timedelta(minutes=scale - i))
+        for i in range(scale)
+    ]
+
+    syslog = [{
+        'id': i,
+        'seqnum': i,
+        'timestamp': now - timedelta(seconds=5 * scale - i),
+        'identifier': rand.choice(['kernel', 'dispatcher', 'sshd', 'smbd']),
+        'message': 'Synthetic log message {0}'.format(i)
+    } for i in range(5 * scale)]
+
+    return {
+        'user': users,
+        'group': groups,
+        'disk': disks,
+        'volume': volumes,
+        'volume.dataset': datasets,
+        'volume.snapshot': snapshots,
+        'task': tasks,
+        'syslog': syslog
+    }
@@ -0,0 +1,186 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+"""
+CLI benchmark suite. Runs the CLI against FakeDispatcher populated with
+synthetic users, groups, disks, datasets, snapshots, tasks and syslog
+entries and reports latency of startup, show, search, dump, tab
+completion and waiting for tasks.
+
+Usage: python benchmarks/run.py [--scale N] [--repeat N] [--json FILE] [--compare FILE]
+
+--json saves the results, --compare prints the difference against
+results saved earlier.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import statistics
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_dispatcher import FakeDispatcher
+from freenas.cli import repl
+from freenas.cli.output import ValueType
+
+
+COMMANDS = [
+    ('show users', 'account user show'),
+    ('show users | search', 'account user show | search name ~= "^user1"'),
+    ('show users | sort | limit', 'account user show | sort -uid | limit 20'),
+    ('show datasets', 'volume dataset show'),
+    ('show snapshots', 'volume snapshot show'),
+    ('show disks', 'disk show'),
+    ('show tasks', 'task show all'),
+    ('show syslog', 'log show'),
+    ('dump users', 'account user dump'),
+]
+
+COMPLETIONS = [
+    ('complete root', ''),
+    ('complete namespace', 'account user '),
+    ('complete item', 'account user user1'),
+    ('complete properties', 'account user user1 set '),
+]
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+def measure(fn, repeat):
+    samples = []
+    for __ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started_at)
+
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples)
+    }
+
+
+def start_cli(args):
+    context = repl.Context()
+    context.connection = FakeDispatcher(args.scale, args.task_duration, args.rpc_latency)
+    context.uri = 'fake:'
+    context.parsed_uri = urlparse('unix:')
+    context.hostname = 'localhost'
+    context.local_connection = True
+    context.read_middleware_config_file(None)
+    context.start()
+    context.ml = repl.MainLoop(context)
+    context.user = 'root'
+    context.login('root', '')
+    context.wait_entity_subscribers()
+    context.variables.set('output', os.devnull)
+    context.variables.set('rollbar_enabled', 'no', ValueType.BOOLEAN)
+    return context
+
+
+def complete(context, line):
+    text = line.rsplit(' ', 1)[-1]
+    repl.readline.get_line_buffer = lambda: line
+    repl.readline.get_begidx = lambda: len(line) - len(text)
+    state = 0
+    while context.ml.complete(text, state) is not None:
+        state += 1
+
+
+def run(args):
+    results = {}
+    contexts = []
+
+    with quiet():
+        results['startup'] = measure(lambda: contexts.append(start_cli(args)), args.repeat)
+
+    context = contexts[-1]
+    with quiet():
+        for name, line in COMMANDS:
+            context.ml.process(line)
+            results[name] = measure(lambda: context.ml.process(line), args.repeat)
+
+        for name, line in COMPLETIONS:
+            results[name] = measure(lambda: complete(context, line), args.repeat)
+
+        context.variables.set('tasks_blocking', 'yes', ValueType.BOOLEAN)
+        results['task wait'] = measure(lambda: context.submit_task('benchmark.noop'), args.repeat)
+
+    return results
+
+
+def print_results(results, baseline=None):
+    print('{0:<28} {1:>10} {2:>10} {3:>10} {4:>9}'.format('Benchmark', 'min', 'median', 'max', 'change'))
+    for name, r in results.items():
+        change = ''
+        if baseline and name in baseline:
+            change = '{0:+.1f}%'.format((r['median'] / baseline[name]['median'] - 1) * 100)
+
+        print('{0:<28} {1:>9.2f}ms {2:>9.2f}ms {3:>9.2f}ms {4:>9}'.format(
+            name,
+            r['min'] * 1000,
+            r['median'] * 1000,
+            r['max'] * 1000,
+            change
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=1000, help='Number of users, datasets and tasks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--task-duration', type=float, default=0.0, help='Seconds each submitted task runs')
+    parser.add_argument('--rpc-latency', type=float, default=0.0, help='Simulated RPC round trip in seconds')
+    parser.add_argument('--json', metavar='FILE', help='Save results to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with results saved in FILE')
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'scale': args.scale, 'repeat': args.repeat, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import os
+import glob
+import time
+import errno
+import hashlib
+import logging
+from freenas.cli import config
+from freenas.dispatcher.entity import EntitySubscriber
+from freenas.dispatcher.jsonenc import dumps, loads
+
+
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(config.CONFIG_DIR, 'cache')
+UPDATE_MARKER = 'updated_at'
+logger = logging.getLogger('cli.cache')
+
+
+class EntityCache(object):
+    """
+    On-disk snapshots of entity subscriber collections, kept separately
+    for every host URI and user.
+    """
+    def __init__(self, uri, user, max_size):
+        self.uri = uri
+        self.user = user
+        self.max_size = max_size
+        self.path = os.path.join(
+            CACHE_DIR,
+            hashlib.sha1('{0}|{1}'.format(uri, user).encode('utf-8')).hexdigest()
+        )
+        self.stats = {}
+
+    def filename(self, name):
+        return os.path.join(self.path, '{0}.json'.format(name))
+
+    def load(self, name):
+        try:
+            with open(self.filename(name), 'r') as f:
+                snapshot = loads(f.read())
+        except (IOError, ValueError):
+            return None
+
+        if snapshot.get('version') != CACHE_VERSION or snapshot.get('name') != name:
+            return None
+
+        return snapshot['items']
+
+    def save(self, name, items):
+        try:
+            os.makedirs(self.path, mode=0o700, exist_ok=True)
+            tmpname = self.filename(name) + '.tmp'
+            with open(tmpname, 'w') as f:
+                f.write(dumps({
+                    'version': CACHE_VERSION,
+                    'name': name,
+                    'uri': self.uri,
+                    'user': self.user,
+                    'saved_at': time.time(),
+                    'items': items
+                }))
+
+            os.rename(tmpname, self.filename(name))
+        except (IOError, OSError) as err:
+            logger.warning('Cannot save entity cache for %s: %s', name, err)
+            return
+
+        self.prune()
+
+    def files(self):
+        return glob.glob(os.path.join(self.path, '*.json'))
+
+    def size(self):
+        return sum(os.path.getsize(i) for i in self.files())
+
+    def prune(self):
+        # Drop least recently written snapshots until we fit in the cap
+        files = sorted(self.files(), key=os.path.getmtime)
+        total = sum(os.path.getsize(i) for i in files)
+        while files and total > self.max_size:
+            victim = files.pop(0)
+            total -= os.path.getsize(victim)
+            os.unlink(victim)
+
+    def flush(self):
+        for i in self.files():
+            try:
+                os.unlink(i)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+
+        self.stats.clear()
+
+    def get_stats(self):
+        for i in sorted(self.files()):
+            name = os.path.basename(i)[:-len('.json')]
+            stats = self.stats.get(name, {})
+            yield {
+                'name': name,
+                'size': os.path.getsize(i),
+                'saved_at': os.path.getmtime(i),
+                'reused': stats.get('reused'),
+                'fetched': stats.get('fetched'),
+                'deleted': stats.get('deleted')
+            }
+
+
+class CachedEntitySubscriber(EntitySubscriber):
+    """
+    Entity subscriber seeded from an EntityCache snapshot. Instead of
+    downloading the whole collection it asks the server only for ids and
+    update markers and fetches the objects which changed since the
+    snapshot was taken.
+    """
+    def __init__(self, client, name, cache, *args, **kwargs):
+        super(CachedEntitySubscriber, self).__init__(client, name, *args, **kwargs)
+        self.cache = cache
+
+    def start(self):
+        snapshot = self.cache.load(self.name)
+        # EntitySubscriber has no hook for its initial query, so its change
+        # handler is subscribed here the same way its start() does it
+        on_changed = getattr(self, '_EntitySubscriber__on_changed', None)
+        if snapshot is None or on_changed is None:
+            super(CachedEntitySubscriber, self).start()
+            return
+
+        event = 'entity-subscriber.{0}.changed'.format(self.name)
+        self.event_handler = self.client.register_event_handler(event, on_changed)
+        try:
+            self.reconcile(snapshot)
+        except Exception as err:
+            logger.warning('Cannot reconcile cached %s collection, resyncing: %s', self.name, err)
+            # super().start() subscribes to changes again
+            self.client.unregister_event_handler(event, self.event_handler)
+            self.event_handler = None
+            self.items.clear()
+            super(CachedEntitySubscriber, self).start()
+            return
+
+        self.ready.set()
+
+    def reconcile(self, snapshot):
+        cached = {i['id']: i for i in snapshot}
+        markers = self.client.call_sync(
+            '{0}.query'.format(self.name),
+            [],
+            {'select': ['id', UPDATE_MARKER]}
+        )
+
+        stale = []
+        for id, marker in markers:
+            obj = cached.get(id)
+            if obj is None or marker is None or obj.get(UPDATE_MARKER) != marker:
+                stale.append(id)
+
+        alive = set(id for id, __ in markers)
+        fetched = []
+        if stale:
+            fetched = self.client.call_sync('{0}.query'.format(self.name), [('id', 'in', stale)])
+
+        for id, obj in cached.items():
+            if id in alive:
+                self.items[id] = obj
+
+        for obj in fetched:
+            self.items[obj['id']] = obj
+
+        self.cache.stats[self.name] = {
+            'reused': len(alive) - len(stale),
+            'fetched': len(fetched),
+            'deleted': len(set(cached) - alive)
+        }
+
+    def save(self):
+        if self.ready.is_set():
+            self.cache.save(self.name, list(self.items.values()))
@@ -38,21 +38,30 @@ import re
 import logging
 import copy
 import getpass
+import itertools
+import collections
+import contextlib
 from datetime import datetime
-from freenas.cli.parser import Quote, parse, unparse, dump_ast
+from freenas.cli.parser import Quote, unparse, dump_ast
+from freenas.cli.script import load_script
+from freenas.cli.profiler import Profiler, phase as profile_phase
 from freenas.cli.complete import NullComplete, EnumComplete
 from freenas.cli.namespace import (
     Command, PipeCommand, CommandException, description,
-    SingleItemNamespace, Namespace, FilteringCommand
+    SingleItemNamespace, Namespace, FilteringCommand, QueryCount
 )
 from freenas.cli.output import (
     Table, ValueType, output_less, format_value,
-    Sequence, read_value, format_output
+    Sequence, read_value, format_output, resolve_cell
 )
 from freenas.cli.output import Object as output_obj, get_terminal_size
+from freenas.cli.predicate import filter_items
+from freenas.cli.taskgroup import TaskGroup
 from freenas.cli.descriptions.tasks import translate as translate_task
 from freenas.cli.utils import TaskPromise, describe_task_state, parse_timedelta, add_tty_formatting, quote, to_ascii
 from freenas.dispatcher.shell import ShellClient
+from freenas.utils import first_or_default
+from freenas.utils.query import get
 from freenas.utils.url import wrap_address
 from urllib.parse import urlparse
 
@@ -946,9 +955,7 @@ class SourceCommand(Command):
                 arg = os.path.expanduser(arg)
                 if os.path.isfile(arg):
                     try:
-                        with open(arg, 'rb') as f:
-                            ast = parse(f.read().decode('utf8'), arg)
-                            context.eval_block(ast)
+                        context.eval_block(load_script(arg))
                     except UnicodeDecodeError as e:
                         raise CommandException(_(
                             "Incorrect filetype, cannot parse file: {0}".format(str(e))
@@ -1051,10 +1058,7 @@ class PendingCommand(Command):
     """
 
     def run(self, context, args, kwargs, opargs):
-        pending = list(filter(
-            lambda t: t['session'] == context.session_id,
-            context.pending_tasks.values()
-        ))
+        pending = context.pending_tasks.session(context.session_id)
 
         return Table(pending, [
             Table.Column('Task ID', 'id'),
@@ -1068,15 +1072,70 @@ class WaitCommand(Command):
     """
     Usage: wait
            wait <task ID>
+           wait all
+           wait group <name>
 
     Example: wait
              wait 100
+             wait all
+             wait group shares
 
-    Show task progress of either all waiting tasks or the
-    specified task. Use 'task show' to determine the task ID.
+    Show task progress of either the most recently submitted task or the
+    specified task. Use 'task show' to determine the task ID. 'wait all'
+    waits for all pending tasks of this session and 'wait group' for tasks
+    submitted by 'task_group', showing their overall progress and listing
+    the tasks which did not succeed.
     """
 
+    def wait_group(self, context, group):
+        context.wait_for_task_group(group)
+        if not group.done:
+            return
+
+        group.close()
+        context.task_groups.pop(group.name, None)
+        failures = group.failures()
+        if not failures:
+            return _("All {0} tasks finished".format(len(group)))
+
+        return Sequence(
+            _("{0} of {1} tasks did not finish".format(len(failures), len(group))),
+            Table(failures, [
+                Table.Column('Task ID', 'id'),
+                Table.Column('Task description', lambda t: translate_task(context, t['name'], t['args'])),
+                Table.Column('Task status', 'state'),
+                Table.Column('Error', lambda t: get(t, 'error.message'))
+            ])
+        )
+
     def run(self, context, args, kwargs, opargs):
+        if args and args[0] == 'all':
+            group = TaskGroup('all', context.entity_subscribers['task'])
+            for t in context.pending_tasks.session(context.session_id, roots=True):
+                group.add(t['id'])
+
+            if not len(group):
+                group.close()
+                return _('No pending tasks found')
+
+            try:
+                return self.wait_group(context, group)
+            finally:
+                group.close()
+
+        if args and args[0] == 'group':
+            if len(args) != 2:
+                raise CommandException(_('Please specify a task group name'))
+
+            group = context.task_groups.get(args[1])
+            if group is None:
+                raise CommandException(_('Task group {0} not found. Known groups: {1}'.format(
+                    args[1],
+                    ', '.join(context.task_groups) or _('none')
+                )))
+
+            return self.wait_group(context, group)
+
         if args:
             try:
                 tid = int(args[0])
@@ -1094,6 +1153,44 @@ class WaitCommand(Command):
         return context.wait_for_task_with_progress(tid)
 
 
+@description("Submit tasks without waiting for each of them")
+class TaskGroupCommand(Command):
+    """
+    Usage: task_group <name> `<code>`
+           task_group <name> `<code>` concurrency=<n>
+
+    Example: task_group luns `for (i = 0; i < 500; i = i + 1) { share iscsi create name=${"lun" + str(i)} size=1g parent=tank }`
+             wait group luns
+
+    Runs <code>, submitting all tasks it creates to the background as part
+    of the named group, with no more than <n> of them (or the value of
+    'task_group_concurrency' option) running at once. Use 'wait group <name>'
+    to wait for all of them and see which ones failed.
+    """
+
+    def run(self, context, args, kwargs, opargs):
+        if len(args) != 2 or not isinstance(args[1], Quote):
+            raise CommandException(_("Provide group name and code fragment to evaluate"))
+
+        if context.task_group is not None:
+            raise CommandException(_("Task groups cannot be nested"))
+
+        name = str(args[0])
+        concurrency = read_value(kwargs.get('concurrency', context.variables.get('task_group_concurrency')), ValueType.NUMBER)
+        group = context.task_groups.get(name)
+        if group is None:
+            group = context.task_groups[name] = TaskGroup(name, context.entity_subscribers['task'])
+
+        group.max_running = concurrency
+        context.task_group = group
+        try:
+            context.eval(args[1].body)
+        finally:
+            context.task_group = None
+
+        return _("{0} tasks submitted to group {1}, use 'wait group {1}' to wait for them".format(len(group), name))
+
+
 class AttachDebuggerCommand(Command):
     """
     Usage: attach_debugger <path to pydevd egg> <host> <port>
@@ -1126,6 +1223,105 @@ class WCommand(Command):
         ])
 
 
+@description("List entity subscribers started in this session")
+class SubscribersCommand(Command):
+    """
+    Usage: subscribers
+
+    Example: subscribers
+
+    List entity subscribers which were started in this session, the
+    number of objects each of them holds and the time it took to sync
+    them with the server. Subscribers are started the first time they
+    are needed.
+    """
+
+    def run(self, context, args, kwargs, opargs):
+        subscribers = context.entity_subscribers
+        return Table(
+            [
+                {
+                    'name': name,
+                    'items': len(subscribers[name].items) if name in subscribers else None,
+                    'sync_time': '{0:.3f}s'.format(info['sync_time']) if info['sync_time'] is not None else None
+                }
+                for name, info in list(subscribers.materialized.items())
+            ],
+            [
+                Table.Column('Name', 'name'),
+                Table.Column('Items', 'items', ValueType.NUMBER),
+                Table.Column('Sync time', 'sync_time')
+            ]
+        )
+
+
+@description("Manage on-disk entity cache")
+class CacheCommand(Command):
+    """
+    Usage: cache stats
+           cache flush
+
+    Examples: cache stats
+              cache flush
+
+    Show statistics of the on-disk entity cache or remove all cached
+    collections for the current host and user. The cache is enabled
+    with "setopt entity_cache=yes".
+    """
+
+    def run(self, context, args, kwargs, opargs):
+        if len(args) != 1 or args[0] not in ('stats', 'flush'):
+            raise CommandException(_("Usage: cache stats|flush"))
+
+        if not context.entity_cache:
+            raise CommandException(_("Entity cache is disabled. Enable it with setopt entity_cache=yes"))
+
+        if args[0] == 'flush':
+            context.entity_cache.flush()
+            return
+
+        stats = list(context.entity_cache.get_stats())
+        for i in stats:
+            i['saved_at'] = datetime.fromtimestamp(i['saved_at'])
+
+        return Table(stats, [
+            Table.Column('Name', 'name'),
+            Table.Column('Size', 'size', ValueType.SIZE),
+            Table.Column('Saved at', 'saved_at', ValueType.DATE),
+            Table.Column('Reused', 'reused', ValueType.NUMBER),
+            Table.Column('Fetched', 'fetched', ValueType.NUMBER),
+            Table.Column('Deleted', 'deleted', ValueType.NUMBER)
+        ])
+
+    def complete(self, context, **kwargs):
+        return [EnumComplete(0, ['stats', 'flush'])]
+
+
+@description("Show notification statistics")
+class NotificationsCommand(Command):
+    """
+    Usage: notifications
+
+    Example: notifications
+
+    Show how many task and event notifications were received, printed,
+    replaced by a newer notification of the same task and summarized.
+    Rate of notifications is controlled by the notify_interval and
+    notify_burst options.
+    """
+
+    def run(self, context, args, kwargs, opargs):
+        stats = context.notifications.get_stats()
+        return output_obj(
+            output_obj.Item('Received', 'received', stats.get('received', 0), ValueType.NUMBER),
+            output_obj.Item('Printed', 'printed', stats.get('printed', 0), ValueType.NUMBER),
+            output_obj.Item('Coalesced', 'coalesced', stats.get('coalesced', 0), ValueType.NUMBER),
+            output_obj.Item('Summarized', 'summarized', stats.get('summarized', 0), ValueType.NUMBER),
+            output_obj.Item('Summaries printed', 'summaries', stats.get('summaries', 0), ValueType.NUMBER),
+            output_obj.Item('Pending', 'pending', stats.get('pending', 0), ValueType.NUMBER)
+        )
+
+
 class TimeCommand(Command):
     """
     Usage: time `<code>`
@@ -1145,6 +1341,45 @@ class TimeCommand(Command):
         return Sequence(*(result + [msg]))
 
 
+class ProfileCommand(Command):
+    """
+    Usage: profile `<code>`
+           profile `<code>` dump=<filename>
+
+    Examples: profile `account user show`
+              profile `volume show` dump=/tmp/volume.pstats
+
+    Runs <code> and prints how much time was spent evaluating it,
+    rendering its output and waiting for each RPC call. If dump is
+    specified, cProfile statistics are saved to that file as well.
+    """
+
+    def run(self, context, args, kwargs, opargs):
+        if len(args) < 1 or not isinstance(args[0], Quote):
+            raise CommandException("Provide code fragment to evaluate")
+
+        if context.profiler:
+            raise CommandException(_("Profiler is already running"))
+
+        profiler = Profiler(context, kwargs.get('dump'))
+        profiler.start()
+        try:
+            with profile_phase('eval'):
+                result = context.eval(args[0].body)
+
+            with profile_phase('render'):
+                for i in result:
+                    if i is not None:
+                        format_output(i)
+        finally:
+            try:
+                profiler.stop()
+            except OSError as err:
+                raise CommandException(_("Cannot save profile to {0}: {1}".format(profiler.dump, err.strerror)))
+
+        return profiler.report()
+
+
 class RemoteCommand(Command):
     """
     Usage: remote `<code>`
@@ -1201,6 +1436,98 @@ def map_opargs(opargs, context):
     return mapped_opargs
 
 
+def local_opargs(input, opargs):
+    if not isinstance(input, Table):
+        return opargs
+
+    result = []
+    for k, o, v in opargs:
+        column, = table_columns(input, [k])
+        if not isinstance(v, (list, tuple)):
+            with contextlib.suppress(ValueError, TypeError):
+                v = read_value(v, column.vt)
+
+        result.append((k, o, v))
+
+    return result
+
+
+def input_items(input):
+    if isinstance(input, Table):
+        return input.data
+
+    if isinstance(input, list):
+        return input
+
+    return None
+
+
+def input_accessor(input, field):
+    if isinstance(input, Table):
+        column, = table_columns(input, [field])
+        return lambda row: resolve_cell(row, column.accessor)
+
+    return lambda item: get(item, field) if isinstance(item, dict) else None
+
+
+def wrap_input(input, items):
+    if isinstance(input, Table):
+        return Table(items, input.columns)
+
+    return Sequence(*items) if isinstance(input, Sequence) else list(items)
+
+
+def filter_input(input, expr):
+    """
+    Filters output of commands which do not filter it by themselves,
+    evaluating the expression locally while the output is consumed.
+    """
+    items = input_items(input)
+    if items is None:
+        return input
+
+    try:
+        result = filter_items(items, expr, lambda field: input_accessor(input, field))
+    except (ValueError, re.error) as err:
+        raise CommandException(_('Invalid filter: {0}'.format(err)))
+
+    return wrap_input(input, result)
+
+
+def sort_input(input, fields):
+    """
+    Sorts output of commands which do not sort it by themselves.
+    """
+    items = input_items(input)
+    if items is None:
+        return input
+
+    # Sorting by the last key first and relying on the sort being stable
+    # orders the items by all of the keys
+    items = list(items)
+    for field in reversed(fields):
+        reverse = field.startswith('-')
+        name = field[1:] if reverse else field
+        accessor = input_accessor(input, name)
+        try:
+            items.sort(key=lambda i: (accessor(i) is not None, accessor(i)), reverse=reverse)
+        except TypeError:
+            raise CommandException(_('Cannot sort on field {0}'.format(name)))
+
+    return wrap_input(input, items)
+
+
+def limit_input(input, limit):
+    """
+    Limits output of commands which do not limit it by themselves.
+    """
+    items = input_items(input)
+    if items is None:
+        return input
+
+    return wrap_input(input, list(itertools.islice(items, limit)))
+
+
 @description("Filter results based on specified conditions")
 class SearchPipeCommand(PipeCommand):
     """
@@ -1212,7 +1539,10 @@ class SearchPipeCommand(PipeCommand):
     """
 
     def run(self, context, args, kwargs, opargs, input=None):
-        return input
+        if context.pipe_filtered:
+            return input
+
+        return filter_input(input, local_opargs(input, opargs))
 
     def serialize_filter(self, context, args, kwargs, opargs):
         mapped_opargs = map_opargs(opargs, context)
@@ -1334,7 +1664,10 @@ class ExcludePipeCommand(PipeCommand):
     """
 
     def run(self, context, args, kwargs, opargs, input=None):
-        return input
+        if context.pipe_filtered:
+            return input
+
+        return filter_input(input, [('nor', (i,)) for i in local_opargs(input, opargs)])
 
     def serialize_filter(self, context, args, kwargs, opargs):
         mapped_opargs = map_opargs(opargs, context)
@@ -1370,7 +1703,10 @@ class SortPipeCommand(PipeCommand):
         return {"params": {"sort": args}}
 
     def run(self, context, args, kwargs, opargs, input=None):
-        return input
+        if context.pipe_filtered:
+            return input
+
+        return sort_input(input, pipe_fields(args))
 
 
 @description("Limit output to specified number of items")
@@ -1385,35 +1721,271 @@ class LimitPipeCommand(PipeCommand):
     Return only the specified number of elements in a list.
     """
 
-    def serialize_filter(self, context, args, kwargs, opargs):
+    def limit(self, args):
         if len(args) == 0:
             raise CommandException(_("Please specify a number to limit."))
         if not isinstance(args[0], int) or len(args) > 1:
             raise CommandException(_(
                 "Invalid syntax {0}. For help see 'help <command>'".format(args)
             ))
-        return {"params": {"limit": args[0]}}
+        return args[0]
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        return {"params": {"limit": self.limit(args)}}
 
     def run(self, context, args, kwargs, opargs, input=None):
-        return input
+        if context.pipe_filtered:
+            return input
+
+        return limit_input(input, self.limit(args))
+
+
+def pipe_fields(args):
+    result = []
+    for i in args:
+        if isinstance(i, (list, tuple)):
+            result.extend(pipe_fields(i))
+            continue
+
+        result.extend(f for f in str(i).split(',') if f)
+
+    return result
 
 
-@description("Display output of the specific field")
+def table_columns(input, fields):
+    columns = []
+    for name in fields:
+        column = first_or_default(lambda c: c.name == name, input.columns)
+        if not column:
+            raise CommandException('Unknown field {0}'.format(name))
+
+        columns.append(column)
+
+    return columns
+
+
+def hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(i) for i in value)
+
+    if isinstance(value, dict):
+        return tuple((k, hashable(v)) for k, v in sorted(value.items()))
+
+    if isinstance(value, set):
+        return frozenset(value)
+
+    return value
+
+
+@description("Display output of the specific fields")
 class SelectPipeCommand(PipeCommand):
     """
-    Usage: <command> | select <field>
+    Usage: <command> | select <field> [<field> ...]
+           <command> | select <field>,<field>,...
 
     Example: account user show | select name
+             volume dataset show | select name,used
 
-    Return only the output of the specified field. Use 'help properties' to
-    determine the valid field (Property) names for a namespace.
+    Return only the output of the specified fields. Use 'help properties' to
+    determine the valid field (Property) names for a namespace. When used
+    directly after 'show', only the selected fields are queried. Elements
+    of the result are keyed by field name, e.g. $(<command> | select name)[0]["name"].
     """
 
+    def fields(self, args):
+        result = pipe_fields(args)
+        if not result:
+            raise CommandException('Please specify at least one field name')
+
+        return result
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        return {"params": {"select": self.fields(args)}}
+
     def run(self, context, args, kwargs, opargs, input=None):
-        if len(args) != 1:
-            raise CommandException('Please specify exactly one field name')
+        fields = self.fields(args)
 
         if isinstance(input, Table):
-            result = Table(None, [Table.Column('Result', 'result')])
-            result.data = ({'result': x.get(args[0])} for x in input)
-            return result
+            # Output of 'show' already consists of the selected columns
+            if [c.name for c in input.columns] == fields:
+                return input
+
+            return Table(input.data, table_columns(input, fields))
+
+
+@description("Count results")
+class CountPipeCommand(PipeCommand):
+    """
+    Usage: <command> | count
+
+    Example: volume snapshot show | count
+             account user show | search uid > 1000 | count
+
+    Return the number of elements in a list. When used after 'show', the
+    elements are counted by the server instead of being fetched.
+    """
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        if args or kwargs or opargs:
+            raise CommandException(_("'count' command doesn't take any arguments"))
+
+        return {"params": {"count": True}}
+
+    def run(self, context, args, kwargs, opargs, input=None):
+        # Stages after this one were not pushed into the query
+        context.pipe_filtered = False
+
+        if isinstance(input, bool):
+            raise CommandException(_('Cannot count a boolean value'))
+
+        # Already counted by the query
+        if isinstance(input, QueryCount):
+            return int(input)
+
+        if isinstance(input, Table):
+            return sum(1 for __ in input.data)
+
+        if isinstance(input, (list, tuple)):
+            return len(input)
+
+        raise CommandException(_('Cannot count {0}'.format(format_value(input))))
+
+
+@description("Sum values of a field")
+class SumPipeCommand(PipeCommand):
+    """
+    Usage: <command> | sum <field>
+
+    Example: volume dataset show | sum used
+             vm show | search enabled==yes | sum memsize
+
+    Return the total of numeric values of the given field. Empty values
+    are skipped.
+    """
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        return {"params": {"aggregate": True}}
+
+    def run(self, context, args, kwargs, opargs, input=None):
+        # Stages after this one were not pushed into the query
+        context.pipe_filtered = False
+
+        fields = pipe_fields(args)
+        if len(fields) != 1:
+            raise CommandException(_("Please specify a single field to sum."))
+
+        if not isinstance(input, Table):
+            raise CommandException(_("'sum' can only be used on lists of items"))
+
+        column, = table_columns(input, fields)
+        total = 0
+        for row in input.data:
+            value = resolve_cell(row, column.accessor)
+            if value is None:
+                continue
+
+            try:
+                total += value
+            except TypeError:
+                raise CommandException(_('Value {0} of field {1} is not a number'.format(value, column.name)))
+
+        return total
+
+
+@description("Group results by a field")
+class GroupByPipeCommand(PipeCommand):
+    """
+    Usage: <command> | group_by <field> [sum=<field>]
+
+    Example: volume snapshot show | group_by dataset
+             volume dataset show | group_by volume sum=used
+
+    Return the distinct values of the given field along with the number
+    of elements having each of them and, optionally, the total of
+    another field within every group.
+    """
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        return {"params": {"aggregate": True}}
+
+    def run(self, context, args, kwargs, opargs, input=None):
+        # Stages after this one were not pushed into the query
+        context.pipe_filtered = False
+
+        fields = pipe_fields(args)
+        sum_fields = pipe_fields([kwargs.pop('sum')]) if 'sum' in kwargs else []
+        if len(fields) != 1 or len(sum_fields) > 1 or kwargs or opargs:
+            raise CommandException(_("Invalid syntax. For help see 'help group_by'"))
+
+        if not isinstance(input, Table):
+            raise CommandException(_("'group_by' can only be used on lists of items"))
+
+        column, = table_columns(input, fields)
+        sum_column = table_columns(input, sum_fields)[0] if sum_fields else None
+        groups = collections.OrderedDict()
+
+        for row in input.data:
+            value = resolve_cell(row, column.accessor)
+            group = groups.get(hashable(value))
+            if group is None:
+                group = groups[hashable(value)] = {column.name: value, 'count': 0}
+                if sum_column:
+                    group['sum'] = 0
+
+            group['count'] += 1
+            if sum_column:
+                item = resolve_cell(row, sum_column.accessor)
+                if item is None:
+                    continue
+
+                try:
+                    group['sum'] += item
+                except TypeError:
+                    raise CommandException(_('Value {0} of field {1} is not a number'.format(item, sum_column.name)))
+
+        columns = [
+            Table.Column(column.label, column.name, column.vt, name=column.name),
+            Table.Column(_('Count'), 'count', ValueType.NUMBER)
+        ]
+
+        if sum_column:
+            columns.append(Table.Column(_('Total {0}'.format(sum_column.label)), 'sum', sum_column.vt))
+
+        return Table(list(groups.values()), columns)
+
+
+@description("Remove duplicate results")
+class UniqPipeCommand(PipeCommand):
+    """
+    Usage: <command> | uniq [<field> ...]
+
+    Example: network interface show | uniq type
+             vm show | uniq datastore,enabled
+
+    Return only the first element for every distinct combination of
+    values of the given fields, showing just these fields. Without fields,
+    drops elements which are duplicates in all of their fields.
+    """
+
+    def serialize_filter(self, context, args, kwargs, opargs):
+        return {"params": {"aggregate": True}}
+
+    def run(self, context, args, kwargs, opargs, input=None):
+        # Stages after this one were not pushed into the query
+        context.pipe_filtered = False
+
+        if not isinstance(input, Table):
+            raise CommandException(_("'uniq' can only be used on lists of items"))
+
+        fields = pipe_fields(args)
+        columns = table_columns(input, fields) if fields else input.columns
+
+        def unique():
+            seen = set()
+            for row in input.data:
+                key = hashable([resolve_cell(row, c.accessor) for c in columns])
+                if key not in seen:
+                    seen.add(key)
+                    yield row
+
+        return Table(unique(), columns)
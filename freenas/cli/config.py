@@ -25,4 +25,8 @@
 #
 #####################################################################
 
+import os
+
+
 instance = None
+CONFIG_DIR = os.path.expanduser('~/.freenascli')
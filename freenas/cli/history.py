@@ -0,0 +1,193 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import os
+import bisect
+import hashlib
+import logging
+import threading
+import collections
+from freenas.cli import config
+from freenas.cli.taskgroup import FINAL_STATES
+from freenas.dispatcher.jsonenc import dumps, loads
+from freenas.utils import query as q
+
+
+HISTORY_DIR = os.path.join(config.CONFIG_DIR, 'history')
+INDEXED_FIELDS = ('state', 'name')
+TIME_FIELD = 'created_at'
+logger = logging.getLogger('cli.history')
+
+
+class TaskHistory(object):
+    """
+    Append-only on-disk log of tasks which ended, kept separately for
+    every host URI and user. The log is read once, on first use, and
+    indexed on task state, name and creation time, so queries only
+    look at records which can match.
+    """
+    def __init__(self, uri, user, max_size):
+        self.max_size = max_size
+        self.path = os.path.join(
+            HISTORY_DIR,
+            '{0}.ndjson'.format(hashlib.sha1('{0}|{1}'.format(uri, user).encode('utf-8')).hexdigest())
+        )
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.clear()
+
+    def __len__(self):
+        with self.lock:
+            self.load()
+            return len(self.records)
+
+    def clear(self):
+        self.records = []
+        self.ids = {}
+        self.indexes = {f: collections.defaultdict(list) for f in INDEXED_FIELDS}
+        self.timeline = []
+
+    def index(self, task):
+        pos = len(self.records)
+        self.records.append(task)
+        self.ids[task['id']] = pos
+        for field in INDEXED_FIELDS:
+            self.indexes[field][task.get(field)].append(pos)
+
+        if task.get(TIME_FIELD) is not None:
+            bisect.insort(self.timeline, (task[TIME_FIELD], pos))
+
+    def load(self):
+        if self.loaded:
+            return
+
+        self.loaded = True
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        task = loads(line)
+                    except ValueError:
+                        # Last line may be cut short if we were killed mid-write
+                        continue
+
+                    if task['id'] not in self.ids:
+                        self.index(task)
+        except IOError:
+            pass
+
+    def get(self, tid):
+        with self.lock:
+            self.load()
+            pos = self.ids.get(tid)
+            return None if pos is None else self.records[pos]
+
+    def extend(self, tasks):
+        """
+        Appends tasks which ended and were not recorded yet.
+        """
+        with self.lock:
+            self.load()
+            tasks = [t for t in tasks if t['state'] in FINAL_STATES and t['id'] not in self.ids]
+            if not tasks:
+                return
+
+            for task in tasks:
+                self.index(task)
+
+            try:
+                os.makedirs(HISTORY_DIR, mode=0o700, exist_ok=True)
+                with open(self.path, 'a') as f:
+                    for task in tasks:
+                        f.write(dumps(task) + '\n')
+            except (IOError, OSError) as err:
+                logger.warning('Cannot write task history: %s', err)
+                return
+
+            # Rewrite the log only once it grew to twice the cap
+            if len(self.records) > 2 * self.max_size:
+                self.prune()
+
+    def append(self, task):
+        self.extend([task])
+
+    def prune(self):
+        records = self.records[-self.max_size:]
+        self.clear()
+        for task in records:
+            self.index(task)
+
+        tmpname = self.path + '.tmp'
+        try:
+            with open(tmpname, 'w') as f:
+                for task in records:
+                    f.write(dumps(task) + '\n')
+
+            os.rename(tmpname, self.path)
+        except (IOError, OSError) as err:
+            logger.warning('Cannot prune task history: %s', err)
+
+    def candidates(self, filter):
+        # Only plain top-level rules narrow the search, everything else
+        # is left for the query below
+        matches = []
+        for rule in filter:
+            if not isinstance(rule, (list, tuple)) or len(rule) != 3:
+                continue
+
+            field, op, value = rule
+            if field in self.indexes and op in ('=', 'in'):
+                values = [value] if op == '=' else value
+                index = self.indexes[field]
+                matches.append(set(p for v in values for p in index.get(v, ())))
+                continue
+
+            if field == TIME_FIELD and op in ('>', '>=', '<', '<=') and value is not None:
+                if op in ('>', '>='):
+                    find = bisect.bisect_right if op == '>' else bisect.bisect_left
+                    start = find(self.timeline, (value, float('inf') if op == '>' else -1))
+                    positions = self.timeline[start:]
+                else:
+                    find = bisect.bisect_right if op == '<=' else bisect.bisect_left
+                    end = find(self.timeline, (value, float('inf') if op == '<=' else -1))
+                    positions = self.timeline[:end]
+
+                matches.append(set(p for __, p in positions))
+
+        if not matches:
+            return list(self.records)
+
+        matches.sort(key=len)
+        positions = set.intersection(*matches)
+        return [self.records[p] for p in sorted(positions)]
+
+    def query(self, *filter, **params):
+        with self.lock:
+            self.load()
+            tasks = self.candidates(filter)
+
+        return q.query(tasks, *filter, **params)
@@ -0,0 +1,161 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import os
+import ast
+import glob
+import json
+import hashlib
+import logging
+
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+logger = logging.getLogger('cli.manifest')
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _literal(node):
+    # Unwraps string literals as well as _("...") gettext calls
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == '_' and node.args:
+        node = node.args[0]
+
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def _method_call(stmt):
+    if not isinstance(stmt, ast.Expr) or not isinstance(stmt.value, ast.Call):
+        return None, None
+
+    call = stmt.value
+    if not isinstance(call.func, ast.Attribute):
+        return None, None
+
+    return call.func.attr, call.args
+
+
+def _class_description(tree, classname):
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or node.name != classname:
+            continue
+
+        for dec in node.decorator_list:
+            if isinstance(dec, ast.Call) and isinstance(dec.func, ast.Name) and dec.func.id == 'description':
+                return _literal(dec.args[0])
+
+    return None
+
+
+def scan_plugin(path):
+    """
+    Statically inspects plugin's ``_init`` function and collects namespaces
+    it attaches and task wildcards it maps. Plugins whose ``_init`` does
+    anything else (or which define ``_login``) are marked as eager.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    tree = ast.parse(source, path)
+    entry = {
+        'sha1': hashlib.sha1(source).hexdigest(),
+        'eager': False,
+        'namespaces': [],
+        'tasks': []
+    }
+
+    functions = {n.name: n for n in tree.body if isinstance(n, ast.FunctionDef)}
+    if '_login' in functions:
+        entry['eager'] = True
+
+    init = functions.get('_init')
+    if not init:
+        return entry
+
+    for stmt in init.body:
+        if isinstance(stmt, ast.Pass):
+            continue
+
+        method, args = _method_call(stmt)
+        if method == 'attach_namespace' and len(args) == 2 and isinstance(args[1], ast.Call):
+            path, ctor = _literal(args[0]), args[1]
+            name = _literal(ctor.args[0]) if ctor.args else None
+            if isinstance(path, str) and isinstance(name, str) and isinstance(ctor.func, ast.Name):
+                entry['namespaces'].append({
+                    'path': path,
+                    'name': name,
+                    'description': _class_description(tree, ctor.func.id)
+                })
+                continue
+
+        if method == 'map_tasks' and len(args) == 2:
+            wildcard = _literal(args[0])
+            if isinstance(wildcard, str):
+                entry['tasks'].append(wildcard)
+                continue
+
+        entry['eager'] = True
+        break
+
+    return entry
+
+
+def generate_manifest(dir):
+    plugins = {}
+    for i in sorted(glob.glob1(dir, '*.py')):
+        plugins[i] = scan_plugin(os.path.join(dir, i))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'plugins': plugins
+    }
+
+    with open(os.path.join(dir, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+    return manifest
+
+
+def load_manifest(dir):
+    try:
+        with open(os.path.join(dir, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.debug('Ignoring plugin manifest in %s: unsupported version', dir)
+        return {}
+
+    return manifest.get('plugins', {})
@@ -35,6 +35,8 @@ import sys
 import collections
 import six
 import inspect
+import operator
+import itertools
 import contextlib
 from freenas.utils import first_or_default, query as q, extend
 from freenas.cli.parser import CommandCall, Literal, Symbol, BinaryParameter, Comment
@@ -124,9 +126,61 @@ class Namespace(object):
         return True
 
     def register_namespace(self, ns):
+        stub = first_or_default(
+            lambda i: isinstance(i, LazyNamespace) and i.get_name() == ns.get_name(),
+            self.nslist
+        )
+
+        if stub:
+            stub.target = ns
+            self.nslist[self.nslist.index(stub)] = ns
+            return
+
         self.nslist.append(ns)
 
 
+class LazyNamespace(Namespace):
+    """
+    Placeholder for a namespace provided by a plugin which was not imported
+    yet. The plugin is loaded the first time the namespace is actually used.
+    """
+    def __init__(self, name, context, plugin, description=None):
+        super(LazyNamespace, self).__init__(name)
+        self.context = context
+        self.plugin = plugin
+        self.description = description or name
+        self.target = None
+
+    def resolve(self):
+        if self.target is None:
+            self.context.load_plugin(self.plugin)
+            if self.target is None:
+                raise CommandException(_("Plugin {0} did not provide namespace {1}".format(self.plugin, self.name)))
+
+        return self.target
+
+    def help(self):
+        return self.resolve().help()
+
+    def serialize(self):
+        return self.resolve().serialize()
+
+    def commands(self):
+        return self.resolve().commands()
+
+    def namespaces(self):
+        return self.resolve().namespaces()
+
+    def on_enter(self):
+        return self.resolve().on_enter()
+
+    def on_leave(self):
+        return self.resolve().on_leave()
+
+    def register_namespace(self, ns):
+        self.resolve().register_namespace(ns)
+
+
 class Command(object):
     def __init__(self, *args, **kwargs):
         self.cwd = None
@@ -236,7 +290,139 @@ class LongIndexCommand(Command):
 
 
 class RootNamespace(Namespace):
-    pass
+    def namespace_by_name(self, name):
+        ns = first_or_default(lambda i: i.get_name() == name, self.nslist)
+        if isinstance(ns, LazyNamespace):
+            return ns.resolve()
+
+        return ns
+
+
+class Relation(object):
+    """
+    Declares that a property holds the key (or a list of keys) of entities
+    from another collection, which are displayed and set by their ``field``.
+    """
+    def __init__(self, name, field='name', key='id'):
+        self.name = name
+        self.field = field
+        self.key = key
+
+    def keys(self, value):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        return [i for i in values if i is not None and isinstance(i, collections.Hashable)]
+
+    def lookup(self, value, resolved):
+        if isinstance(value, (list, tuple)):
+            return [self.lookup(i, resolved) for i in value]
+
+        if value is None or not isinstance(value, collections.Hashable):
+            return value
+
+        return resolved.get(value)
+
+    def resolve(self, context, keys):
+        """
+        Maps given keys to related entities' field values in one pass, using
+        the entity subscriber if the collection has one and a single query
+        call otherwise. Keys which could not be resolved are left out.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+
+        try:
+            subscriber = context.entity_subscribers[self.name]
+        except KeyError:
+            return {k: v for k, v in context.call_sync(
+                '{0}.query'.format(self.name),
+                [(self.key, 'in', list(keys))],
+                {'select': [self.key, self.field]}
+            )}
+
+        if self.key == 'id':
+            subscriber.wait_ready()
+            entities = (subscriber.items.get(i) for i in keys)
+        else:
+            index = context.entity_subscribers.index(self.name, self.key)
+            entities = (index.get(i) for i in keys)
+
+        return {q.get(i, self.key): q.get(i, self.field) for i in entities if i is not None}
+
+    def reverse(self, context, value):
+        if isinstance(value, (list, tuple)):
+            return [self.reverse(context, i) for i in value]
+
+        if value is None:
+            return None
+
+        try:
+            context.entity_subscribers[self.name]
+            entity = context.entity_subscribers.index(self.name, self.field).get(value)
+        except KeyError:
+            entity = context.call_sync('{0}.query'.format(self.name), [(self.field, '=', value)], {'single': True})
+
+        if not entity:
+            raise CommandException(_('{0} not found'.format(value)))
+
+        return q.get(entity, self.key)
+
+
+class RelationResolver(object):
+    """
+    Column accessor for a relation property which remembers resolved keys,
+    so that rows can be prefetched in bulk before they are rendered.
+    """
+    def __init__(self, context, mapping):
+        self.context = context
+        self.mapping = mapping
+        self.resolved = {}
+
+    def prefetch(self, rows):
+        relation = self.mapping.relation
+        missing = set()
+        for row in rows:
+            missing.update(i for i in relation.keys(q.get(row, self.mapping.get)) if i not in self.resolved)
+
+        if missing:
+            resolved = relation.resolve(self.context, missing)
+            self.resolved.update((i, resolved.get(i)) for i in missing)
+
+    def __call__(self, row):
+        if self.mapping.create_arg or self.mapping.condition and not self.mapping.condition(row):
+            return None
+
+        self.prefetch([row])
+        return self.mapping.relation.lookup(q.get(row, self.mapping.get), self.resolved)
+
+
+def prefetch_relations(resolvers, data, page_size):
+    """
+    Resolves relation columns of given rows ahead of rendering - all at
+    once for a list, a page at a time for a generator.
+    """
+    if not resolvers:
+        return data
+
+    if isinstance(data, list):
+        for i in resolvers:
+            i.prefetch(data)
+
+        return data
+
+    def pages():
+        it = iter(data)
+        while True:
+            page = list(itertools.islice(it, page_size or 100))
+            if not page:
+                return
+
+            for i in resolvers:
+                i.prefetch(page)
+
+            yield from page
+
+    return pages()
 
 
 class PropertyMapping(object):
@@ -264,6 +450,7 @@ class PropertyMapping(object):
         self.width = kwargs.pop('width', None)
         self.strict = kwargs.pop('strict', True)
         self.set_condition = kwargs.pop('set_condition', None)
+        self.relation = kwargs.pop('relation', None)
 
     def can_set(self, obj):
         if not self.set:
@@ -290,6 +477,10 @@ class PropertyMapping(object):
         if isinstance(self.get, collections.Callable):
             return self.get(obj)
 
+        if self.relation:
+            value = q.get(obj, self.get)
+            return self.relation.lookup(value, self.relation.resolve(self.context, self.relation.keys(value)))
+
         return q.get(obj, self.get)
 
     def do_set(self, obj, value, check_entity=None):
@@ -317,6 +508,9 @@ class PropertyMapping(object):
             self.set(obj, value)
             return
 
+        if self.relation:
+            value = self.relation.reverse(self.context, value)
+
         q.set(obj, self.set, value)
 
     def do_append(self, obj, value):
@@ -947,6 +1141,13 @@ class SingleItemNamespace(ItemNamespace):
         yield from iter(self.parent.entity_namespaces(self))
 
 
+class QueryCount(int):
+    """
+    Number of entities counted by the query a 'count' pipe stage was
+    pushed into.
+    """
+
+
 @description("Lists <entity>s")
 class BaseListCommand(FilteringCommand):
     """
@@ -982,12 +1183,19 @@ class BaseListCommand(FilteringCommand):
                     dummy_entity = {}
                     prop.set(dummy_entity, v)
                     v = dummy_entity[prop.get_name]
+                elif prop.relation and op in ('=', '!=', 'in', 'nin', 'contains'):
+                    v = prop.relation.reverse(self.parent.context, v)
                 yield prop.get_name, op, v
 
     def run(self, context, args, kwargs, opargs, filtering=None):
         cols = []
         params = []
         options = {}
+        resolvers = []
+        count = False
+        aggregate = False
+        selected = None
+        mappings = [i for i in self.parent.property_mappings if i.list]
 
         if filtering:
             for k, v in filtering['params'].items():
@@ -1016,17 +1224,56 @@ class BaseListCommand(FilteringCommand):
                         options.setdefault('sort', []).append(neg + prop.get)
                     continue
 
+                if k == 'count':
+                    count = True
+                    continue
+
+                if k == 'aggregate':
+                    # Results are aggregated further down the pipe, so
+                    # they cannot be counted by the query
+                    aggregate = True
+                    continue
+
+                if k == 'select':
+                    # Names which are not properties are left for the
+                    # select command to resolve against the table
+                    props = [self.parent.get_mapping(name) for name in v]
+                    if all(props):
+                        mappings = selected = props
+                    continue
+
                 raise CommandException('Unknown field {0}'.format(k))
 
             params = list(self.__map_filter_properties(filtering['filter']))
 
-        for col in self.parent.property_mappings:
-            if not col.list:
-                continue
+        if count and not aggregate and self.parent.can_count():
+            options['count'] = True
+            return QueryCount(self.parent.query(params, options))
+
+        if selected and self.parent.can_select(selected):
+            # Let the query return just the selected fields, in order
+            options['select'] = [i.get for i in mappings]
+            for idx, col in enumerate(mappings):
+                cols.append(Table.Column(col.descr, operator.itemgetter(idx), col.type, col.width, col.name))
+        else:
+            for col in mappings:
+                accessor = col.do_get
+                if col.relation and isinstance(col.get, six.string_types):
+                    accessor = RelationResolver(context, col)
+                    resolvers.append(accessor)
+
+                cols.append(Table.Column(col.descr, accessor, col.type, col.width, col.name))
 
-            cols.append(Table.Column(col.descr, col.do_get, col.type, col.width, col.name))
+        page_size = context.variables.get('page_size')
+        if self.parent.large:
+            # Rows of large namespaces are fetched page by page while
+            # the table is being printed
+            data = self.parent.query_pages(params, options, page_size)
+            result = Table(prefetch_relations(resolvers, data, page_size), cols)
+            result.paged = True
+            return result
 
-        return Table(self.parent.query(params, options), cols)
+        return Table(prefetch_relations(resolvers, self.parent.query(params, options), page_size), cols)
 
 
 @description("Lists <entity>s")
@@ -1188,6 +1435,47 @@ class EntityNamespace(Namespace):
     def wait_one(self, name):
         return
 
+    def query_pages(self, params, options, page_size):
+        """
+        Yields query results fetched page_size items at a time using
+        offset and limit, stopping as soon as the requested limit is met.
+        """
+        # Reversing has to see the whole result at once
+        if options.get('reverse') or not page_size:
+            yield from self.query(params, options)
+            return
+
+        limit = options.pop('limit', None)
+        offset = options.pop('offset', 0)
+        while limit is None or limit > 0:
+            count = page_size if limit is None else min(page_size, limit)
+            page = self.query(params, extend(options, {'limit': count, 'offset': offset}))
+            yield from page
+
+            if len(page) < count:
+                return
+
+            offset += count
+            if limit is not None:
+                limit -= count
+
+    def generic_query(self):
+        # Only generic query implementations are known to honor options
+        # such as 'select' and 'count'
+        return type(self).query in (RpcBasedLoadMixin.query, EntitySubscriberBasedLoadMixin.query)
+
+    def can_count(self):
+        return self.generic_query() and not self.context.docgen_run
+
+    def can_select(self, mappings):
+        if not self.generic_query():
+            return False
+
+        return all(
+            isinstance(i.get, six.string_types) and not i.condition and not i.create_arg and not i.relation
+            for i in mappings
+        )
+
     def update_entity(self, name):
         raise NotImplementedError()
 
@@ -1216,14 +1504,23 @@ class EntityNamespace(Namespace):
         if item:
             return SingleItemNamespace(name, self, self.context)
 
-    def namespaces(self, name=None):
-        if self.primary_key is None or self.large:
+    def entity_names(self):
+        for i in self.query([], {'limit': 100}):
+            yield self.primary_key.do_get(i)
+
+    def namespaces(self, name=None, entities=True):
+        if self.primary_key is None or self.large or not entities:
             return
 
-        for i in self.query([], {'limit': 100}):
-            name = self.primary_key.do_get(i)
+        for name in self.entity_names():
             yield SingleItemNamespace(name, self, self.context)
 
+    def static_namespaces(self):
+        """
+        Returns child namespaces other than the ones created for entities.
+        """
+        return list(self.namespaces(entities=False))
+
 
 class RpcBasedLoadMixin(object):
     def __init__(self, *args, **kwargs):
@@ -1257,6 +1554,9 @@ class EntitySubscriberBasedLoadMixin(object):
         self.entity_subscriber_name = None
         self.extra_query_params = []
 
+    def get_name_index(self):
+        return self.context.entity_subscribers.index(self.entity_subscriber_name, self.primary_key_name)
+
     def on_enter(self, *args, **kwargs):
         super(EntitySubscriberBasedLoadMixin, self).on_enter(*args, **kwargs)
         self.context.entity_subscribers[self.entity_subscriber_name].on_delete.add(self.on_delete)
@@ -1290,7 +1590,29 @@ class EntitySubscriberBasedLoadMixin(object):
         else:
             return {}
 
+    def entity_names(self):
+        if self.context.docgen_run:
+            return
+
+        names = self.get_name_index()
+        if self.primary_key_name == self.primary_key.get and not self.extra_query_params:
+            yield from names
+            return
+
+        for i in names:
+            entity = names.get(i, *self.extra_query_params)
+            if entity:
+                yield self.primary_key.do_get(entity)
+
+    def query_pages(self, params, options, page_size):
+        # The collection is already held locally, so a single pass is
+        # cheaper than sorting it again for every page
+        yield from self.query(params, options)
+
     def get_one(self, name):
+        if isinstance(name, collections.Hashable):
+            return copy.deepcopy(self.get_name_index().get(name, *self.extra_query_params))
+
         self.context.entity_subscribers[self.entity_subscriber_name].wait_ready()
         return copy.deepcopy(self.context.entity_subscribers[self.entity_subscriber_name].query(
             (self.primary_key_name, '=', name), *self.extra_query_params,
@@ -0,0 +1,130 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import time
+import gettext
+import threading
+import collections
+
+
+t = gettext.translation('freenas-cli', fallback=True)
+_ = t.gettext
+
+
+SUMMARIZED_KINDS = {'created', 'finished', 'waiting'}
+
+
+class NotificationQueue(object):
+    """
+    Collects task and event notifications on their way to the output
+    thread. Notifications sharing a key (e.g. state changes of a single
+    task) replace each other until printed, output is flushed at most
+    once per ``notify_interval`` milliseconds and task state changes in
+    flushes larger than ``notify_burst`` are printed as a one-line summary.
+    Errors, validation errors and warnings are always printed in full.
+    """
+    def __init__(self, output_queue, variables):
+        self.output_queue = output_queue
+        self.variables = variables
+        self.pending = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.flush_thread)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, message, key=None, kind='event'):
+        """
+        Queues a message. Messages without a key are never coalesced.
+        ``kind`` is what the message gets counted as in summaries.
+        """
+        with self.lock:
+            self.counters['received'] += 1
+            if key is None:
+                key = ('message', self.counters['received'])
+            elif key in self.pending:
+                self.counters['coalesced'] += 1
+                del self.pending[key]
+
+            self.pending[key] = (message, kind)
+
+        self.ready.set()
+
+    def flush(self):
+        with self.lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.ready.clear()
+
+        if not pending:
+            return
+
+        # Only routine task state changes are ever summarized, the text of
+        # errors and warnings would not be recoverable otherwise
+        burst = self.variables.get('notify_burst')
+        routine = [kind for __, kind in pending if kind in SUMMARIZED_KINDS]
+        summarize = bool(burst) and burst > 0 and len(routine) > burst
+        printed = 0
+
+        if summarize:
+            kinds = collections.Counter(routine)
+            self.output_queue.put(_("{0} notifications: {1}".format(
+                len(routine),
+                ', '.join('{0} {1}'.format(count, kind) for kind, count in kinds.most_common())
+            )))
+
+        for message, kind in pending:
+            if summarize and kind in SUMMARIZED_KINDS:
+                continue
+
+            self.output_queue.put(message)
+            printed += 1
+
+        with self.lock:
+            self.counters['printed'] += printed
+            if summarize:
+                self.counters['summarized'] += len(routine)
+                self.counters['summaries'] += 1
+
+    def flush_thread(self):
+        while True:
+            self.ready.wait()
+            self.flush()
+
+            # Rate limit redraws; whatever arrives in the meantime gets
+            # coalesced and printed with the next flush
+            interval = self.variables.get('notify_interval')
+            if interval:
+                time.sleep(interval / 1000.0)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['pending'] = len(self.pending)
+
+        return stats
@@ -30,21 +30,29 @@ import importlib
 import sys
 import gettext
 import enum
-import time
 import contextlib
 import io
 import six
 import pydoc
-import collections
 
 from freenas.utils.permissions import get_unix_permissions, string_to_int
 from freenas.cli import config
 from freenas.utils import first_or_default
 from freenas.dispatcher import Password
-from threading import Lock, Thread
+from threading import Lock
 
 
 output_lock = Lock()
+UNRESOLVED = object()
+formatters = {
+    'ascii': 'freenas.cli.output.ascii',
+    'json': 'freenas.cli.output.json',
+    'ndjson': 'freenas.cli.output.ndjson',
+    'csv': 'freenas.cli.output.csv',
+    'tsv': 'freenas.cli.output.tsv',
+    'python': 'freenas.cli.output.python'
+}
+output_formats = ['ascii', 'json', 'ndjson', 'csv', 'tsv']
 t = gettext.translation('freenas-cli', fallback=True)
 _ = t.gettext
 
@@ -137,29 +145,120 @@ class Table(object):
             }
 
     def __init__(self, data, columns):
-        self.data = data
         self.columns = columns
+        self.data = data
+        self.paged = False
+
+    @property
+    def data(self):
+        return self.__data
+
+    @data.setter
+    def data(self, value):
+        # Resolved and formatted cells are stored column-wise and filled
+        # lazily, so that every accessor runs at most once per row
+        self.__data = value
+        self.cells = {}
+        self.formatted = {}
 
     def __len__(self):
         return len(self.data)
 
     def __iter__(self):
-        for i in self.data:
-            yield {c.name: resolve_cell(i, c.accessor) for c in self.columns}
+        names = [c.name for c in self.columns]
+        for i in self.rows():
+            yield dict(zip(names, i))
 
     def __getitem__(self, item):
-        return {c.name: resolve_cell(self.data[item], c.accessor) for c in self.columns}
+        return {c.name: self.cell(item, idx) for idx, c in enumerate(self.columns)}
 
     def __getstate__(self):
         return {
             'type': self.__class__.__name__,
             'columns': [i.__getstate__() for i in self.columns],
-            'data': [
-                [resolve_cell(i, c.accessor) for c in self.columns] for i in self.data
-            ]
+            'data': list(self.rows())
         }
 
+    def cached(self):
+        return isinstance(self.data, list)
+
+    def column_cells(self, store, key):
+        values = store.get(key)
+        if values is None:
+            values = store[key] = [UNRESOLVED] * len(self.data)
+
+        return values
+
+    def cell(self, row, column):
+        if not self.cached():
+            return resolve_cell(self.data[row], self.columns[column].accessor)
+
+        values = self.column_cells(self.cells, column)
+        value = values[row]
+        if value is UNRESOLVED:
+            value = values[row] = resolve_cell(self.data[row], self.columns[column].accessor)
+
+        return value
+
+    def formatted_cell(self, row, column, formatter):
+        if not self.cached():
+            return formatter.format_value(self.cell(row, column), self.columns[column].vt)
+
+        values = self.column_cells(self.formatted, (formatter, column))
+        value = values[row]
+        if value is UNRESOLVED:
+            value = values[row] = formatter.format_value(self.cell(row, column), self.columns[column].vt)
+
+        return value
+
+    def rows(self, cache=True):
+        """
+        Yields lists of resolved cell values, one per row. Rows of a table
+        backed by a generator, or requested with cache=False by outputs
+        which go over the table just once, are resolved on the fly.
+        """
+        if not cache or not self.cached():
+            for i in self.data:
+                yield [resolve_cell(i, c.accessor) for c in self.columns]
+            return
+
+        accessors = [c.accessor for c in self.columns]
+        cells = [self.column_cells(self.cells, c) for c in range(len(self.columns))]
+        for idx, row in enumerate(self.data):
+            values = []
+            for accessor, column in zip(accessors, cells):
+                value = column[idx]
+                if value is UNRESOLVED:
+                    value = column[idx] = resolve_cell(row, accessor)
+
+                values.append(value)
+
+            yield values
+
+    def formatted_rows(self, formatter, cache=True):
+        if not cache or not self.cached():
+            for i in self.rows(cache):
+                yield [formatter.format_value(v, c.vt) for v, c in zip(i, self.columns)]
+            return
+
+        vts = [c.vt for c in self.columns]
+        cells = [self.column_cells(self.formatted, (formatter, c)) for c in range(len(self.columns))]
+        for idx, row in enumerate(self.rows()):
+            values = []
+            for value, vt, column in zip(row, vts, cells):
+                formatted = column[idx]
+                if formatted is UNRESOLVED:
+                    formatted = column[idx] = formatter.format_value(value, vt)
+
+                values.append(formatted)
+
+            yield values
+
     def pop(self, pop_index):
+        if self.cached():
+            for i in list(self.cells.values()) + list(self.formatted.values()):
+                i.pop(pop_index)
+
         return self.data.pop(pop_index)
 
 
@@ -184,88 +283,111 @@ class Sequence(list):
         }
 
 
-class ProgressBar(object):
+class TaskProgressView(object):
+    """
+    Progress display of a set of tasks and their subtasks. It does not
+    poll: ``draw`` is called by whoever follows the tasks every time one
+    of them changes. On a terminal the tasks are drawn as a compact
+    multi-line view updated in place, otherwise a line is printed every
+    time state, progress or status message of a task changes.
+    """
+    bar_width = 20
+
     def __init__(self):
-        self.message = None
-        self.percentage = 0
-        self.draw_t = Thread(target=self.draw) if sys.stdout.isatty() else Thread(target=self.draw_static)
-        self.finished = False
-        sys.stdout.write('\n')
-        self.draw_t.daemon = True
-        self.draw_t.start()
-
-    def draw(self):
-        progress_width = 40
-        none_fill = ''.join('#' if i < 8 else '_' for i in range(progress_width))
-
-        def get_none_fill(f):
-            asc = True
-            while True:
-                yield f
-                if asc:
-                    f = f[-1] + f[:-1]
-                    if f[-1] == '#':
-                        asc = False
-                else:
-                    f = f[1:] + f[0]
-                    if f[0] == '#':
-                        asc = True
-
-        generator = get_none_fill(none_fill)
-        while True:
-            if self.percentage is None:
-                none_fill = next(generator)
-                fill = none_fill
-            else:
-                filled_width = int(self.percentage * progress_width)
-                fill = '#' * filled_width + '_' * (progress_width - filled_width)
-
-            sys.stdout.write('\033[2K\033[A\033[2K\r')
-            sys.stdout.write('Status: {}\n'.format(self.message))
-            sys.stdout.write('Total task progress: [{}] '.format(fill) +
-                             ('' if self.percentage is None else '{:.2%}'.format(self.percentage)))
-
-            sys.stdout.flush()
-            if self.finished:
-                break
-            time.sleep(0.5)
-
-    def draw_static(self):
-        old_message = ''
-
-        while True:
-            status = ''
-
-            if self.percentage is not None:
-                if self.message:
-                    status = 'Status {}. '.format(self.message)
-                status += 'Progress {:.2%}\n'.format(self.percentage)
-            elif old_message != self.message:
-                old_message = self.message
-                status = 'Status {}\n'.format(self.message)
-
-            if status:
-                sys.stdout.write(status)
-                sys.stdout.flush()
-
-            if self.finished:
-                break
-
-            time.sleep(1)
-
-    def update(self, percentage=None, message=None):
-        self.percentage = None if percentage is None else float(percentage / 100.0)
-
-        if message:
-            self.message = message
-
-    def finish(self):
-        self.percentage = 1
+        self.tty = sys.stdout.isatty()
+        self.lines = 0
+        self.logged = {}
+
+    @staticmethod
+    def describe(task):
+        if task.get('description'):
+            return task['description']['message']
+
+        return task['name']
+
+    @staticmethod
+    def progress(task):
+        progress = task.get('progress') or {}
+        return progress.get('percentage'), progress.get('message')
+
+    def bar(self, percentage):
+        if percentage is None:
+            return '[{0}]      '.format('?' * self.bar_width)
+
+        filled = int(min(percentage, 100) * self.bar_width / 100)
+        return '[{0}{1}] {2:>5.1f}%'.format('#' * filled, '_' * (self.bar_width - filled), percentage)
+
+    def format_task(self, depth, task):
+        percentage, message = self.progress(task)
+        if task['state'] == 'FINISHED':
+            percentage = 100
+
+        return '{0}#{1} {2} {3} {4}{5}'.format(
+            '  ' * depth,
+            task['id'],
+            self.bar(percentage),
+            task['state'].lower(),
+            self.describe(task),
+            ': {0}'.format(message) if message else ''
+        )
+
+    def draw(self, rows, status=None, percentage=None):
+        """
+        Shows ``rows``, a list of (depth, task) pairs, optionally preceded
+        by an overall status line.
+        """
+        if not self.tty:
+            self.log(rows, status)
+            return
+
+        height, width = get_terminal_size()
+        width = int(width)
+        lines = []
+        if status is not None:
+            lines.append('{0} {1}'.format(self.bar(percentage), status))
+
+        room = max(int(height) - len(lines) - 2, 1)
+        if len(rows) > room:
+            lines.extend(self.format_task(depth, task) for depth, task in rows[:room - 1])
+            lines.append('... {0} more'.format(len(rows) - room + 1))
+        else:
+            lines.extend(self.format_task(depth, task) for depth, task in rows)
+
+        # Move back to the first line of the previous frame and repaint
+        if self.lines:
+            sys.stdout.write('\033[{0}A'.format(self.lines))
+
+        sys.stdout.write('\033[J')
+        for line in lines:
+            sys.stdout.write(line[:width - 1] + '\n')
+
+        sys.stdout.flush()
+        self.lines = len(lines)
+
+    def log(self, rows, status):
+        if status is not None and self.logged.get(None) != status:
+            self.logged[None] = status
+            sys.stdout.write('Status: {0}\n'.format(status))
+
+        for depth, task in rows:
+            percentage, message = self.progress(task)
+            key = (task['state'], percentage, message)
+            if self.logged.get(task['id']) == key:
+                continue
+
+            self.logged[task['id']] = key
+            sys.stdout.write('Task #{0}: {1}: {2}{3}{4}\n'.format(
+                task['id'],
+                self.describe(task),
+                task['state'].lower(),
+                '' if percentage is None else ' {0:.2f}%'.format(percentage),
+                ': {0}'.format(message) if message else ''
+            ))
+
+        sys.stdout.flush()
 
     def end(self):
-        self.finished = True
-        self.draw_t.join()
-        sys.stdout.write('\n')
+        self.lines = 0
 
 
 def get_terminal_size(fd=1):
@@ -295,7 +417,7 @@ def resolve_cell(row, spec):
     if type(spec) == str:
         return row.get(spec)
 
-    if isinstance(spec, collections.Callable):
+    if callable(spec):
         return spec(row)
 
     return '<unknown>'
@@ -403,9 +525,27 @@ def output_tree(tree, children, label, fmt=None, **kwargs):
     return get_formatter(fmt).output_tree(tree, children, label, **kwargs)
 
 
+def register_formatter(name, formatter, selectable=True):
+    """
+    Registers an output formatter under given name. Formatter can be
+    either a formatter class or a name of module with _formatter()
+    function, which is imported when the formatter is used first time.
+    Selectable formatters can be set as 'output_format'.
+    """
+    formatters[name] = formatter
+    if selectable and name not in output_formats:
+        output_formats.append(name)
+
+
 def get_formatter(name):
-    module = importlib.import_module('freenas.cli.output.' + name)
-    return module._formatter()
+    formatter = formatters.get(name)
+    if formatter is None:
+        raise ValueError(_("Unknown output format: {0}".format(name)))
+
+    if isinstance(formatter, str):
+        formatter = formatters[name] = importlib.import_module(formatter)._formatter()
+
+    return formatter
 
 
 def output_msg(message, fmt=None, **kwargs):
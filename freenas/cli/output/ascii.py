@@ -32,7 +32,7 @@ import datetime
 import time
 import gettext
 import natural.date
-import math
+import itertools
 from dateutil.parser import parse
 from texttable import Texttable
 from freenas.cli import config
@@ -199,11 +199,12 @@ class AsciiOutputFormatter(object):
         if editable_column: 
             cols.append(Table.Column("Settable", 'editable'))
 
-        table = AsciiOutputFormatter.format_table(Table(values, cols))
+        tab = Table(values, cols)
+        table = AsciiOutputFormatter.format_table(tab)
         try:
             six.print_(table.draw(), file=file, end=('\n' if kwargs.get('newline', True) else ' '))
         except UnicodeEncodeError:
-            table = AsciiOutputFormatter.format_table(Table(values, cols), conv2ascii=True)
+            table = AsciiOutputFormatter.format_table(tab, conv2ascii=True)
             six.print_(table.draw(), file=file, end=('\n' if kwargs.get('newline', True) else ' '))
 
     @staticmethod
@@ -228,16 +229,40 @@ class AsciiOutputFormatter(object):
 
     @staticmethod
     def _print_stream_table(tab, file, end):
-        def _print_header(columns, file, end, printer=None):
-            printer.print_header(columns, file, end) if printer else six.print_([col.label for col in columns], file=file, end=end)
+        def _print_rows(rows, file, end, printer, page_height=None):
+            for row, elements in rows:
+                if page_height and printer.lines_printed >= page_height:
+                    if not _next_page():
+                        return
 
-        def _print_rows(rows, columns, file, end, printer=None):
-            for row in rows:
-                printer.print_row(row, file, end) if printer else six.print_([row[col.accessor] for col in columns], file=file, end=end)
+                    printer.lines_printed = 0
 
+                printer.print_row(row, file, end, elements)
+
+        def _next_page():
+            try:
+                answer = six.moves.input(_("-- More -- (press Enter to continue or q to quit) "))
+            except (EOFError, KeyboardInterrupt):
+                return False
+
+            return answer.strip().lower() != 'q'
+
+        # Large namespaces are shown a screen at a time on a terminal
+        page_height = None
+        if tab.paged and config.instance.variables.get('interactive_paging'):
+            if getattr(file, 'isatty', lambda: False)() and sys.stdin.isatty():
+                page_height = get_terminal_size()[0] - 1
+
+        # Only the first rows are held in memory to size the columns,
+        # the rest is printed as it comes
+        rows = tab.rows()
+        sample = list(itertools.islice(rows, config.instance.variables.get('table_sample_rows') or 0))
         printer = AsciiStreamTablePrinter()
-        _print_header(tab.columns, file, end, printer=printer)
-        _print_rows(tab.data, tab.columns, file, end, printer=printer)
+        formatted = printer.print_header(tab.columns, file, end, sample)
+        _print_rows(
+            itertools.chain(zip(sample, formatted), ((row, None) for row in rows)),
+            file, end, printer, page_height=page_height
+        )
 
     def format_table(tab, conv2ascii=False):
         def _try_conv2ascii(s):
@@ -254,12 +279,12 @@ class AsciiOutputFormatter(object):
         remaining_space = max_width
         # set maximum column width based on the amount of terminal space minus the 3 pixel borders
         max_col_width = (remaining_space - number_columns * 3) / number_columns
+        rows = list(tab.rows())
         for i in range(0, number_columns):
             current_width = len(tab.columns[i].label)
-            tab_cols_acc = tab.columns[i].accessor
-            if len(tab.data) > 0:
+            if len(rows) > 0:
                 max_row_width = max(
-                        [len(str(resolve_cell(row, tab_cols_acc))) for row in tab.data ]
+                        [len(str(row[i])) for row in rows]
                         )
                 ideal_widths.insert(i, max_row_width)
                 current_width = max_row_width if max_row_width > current_width else current_width
@@ -290,10 +315,9 @@ class AsciiOutputFormatter(object):
         table.set_cols_dtype(['t'] * len(tab.columns))
         if conv2ascii:
             table.add_rows([[AsciiOutputFormatter.format_value(
-                _try_conv2ascii(resolve_cell(row, i.accessor)), i.vt) for i in tab.columns] for row in tab.data], False)
+                _try_conv2ascii(value), col.vt) for value, col in zip(row, tab.columns)] for row in rows], False)
         else:
-            table.add_rows([[AsciiOutputFormatter.format_value(
-                resolve_cell(row, i.accessor), i.vt) for i in tab.columns] for row in tab.data], False)
+            table.add_rows(list(tab.formatted_rows(AsciiOutputFormatter)), False)
         return table
 
 
@@ -305,6 +329,7 @@ class AsciiStreamTablePrinter(object):
     def __init__(self):
         self.display_size = get_terminal_size()[1]
         self.usable_display_width = self.display_size
+        self.lines_printed = 0
         self._cleanup_all()
         self.visible_separators = False
 
@@ -317,18 +342,19 @@ class AsciiStreamTablePrinter(object):
         self.ordered_lines_elements = []
         self.ordered_lines = []
 
-    def print_header(self, columns, file, end):
-        self._compute_cols_widths(columns)
-        self._load_accessors(columns)
+    def print_header(self, columns, file, end, sample=None):
         self._load_value_types(columns)
+        formatted = [self._format_row_elements(row) for row in sample or []]
+        self._compute_cols_widths(columns, formatted)
         self._load_header_elements(columns)
         self._trim_elements()
         self._render_lines()
         self._add_vertical_separator_line()
         self._print_lines(file, end)
+        return formatted
 
-    def print_row(self, row, file, end):
-        self._load_row_elements(row)
+    def print_row(self, row, file, end, elements=None):
+        self._load_row_elements(row, elements=elements)
         self._trim_elements()
         self._render_lines()
         try:
@@ -340,37 +366,46 @@ class AsciiStreamTablePrinter(object):
             self._render_lines()
             self._print_lines(file, end)
 
-    def _compute_cols_widths(self, columns):
-        def extend_cols_widths(additional_space):
-            for i, col in enumerate(self.cols_widths):
-                if not additional_space:
-                    return
-                self.cols_widths[i] += 1
-                additional_space -= 1
-
+    def _compute_cols_widths(self, columns, formatted):
         self.borders_space = len(columns) + 1
+        available = self.display_size - self.borders_space
 
-        default_col_width_percentage = 100
-        reserved_width_percentage = 0
-        reserved_cols_count = 0
-        for col in columns:
-            if col.width:
-                reserved_width_percentage += col.width
-                reserved_cols_count += 1
-        if len(columns) != reserved_cols_count:
-            default_col_width_percentage = int((100 - reserved_width_percentage) / (len(columns) - reserved_cols_count))
-        for col in columns:
-            if not col.width:
-                col.width = default_col_width_percentage
-        cols_widths_fracts_ints = [math.modf((self.display_size-self.borders_space)*(col.width/100))
-                                  for col in columns]
-        space_from_fracts = int(sum([col[0] for col in cols_widths_fracts_ints]))
-        self.cols_widths = [int(col[1]) for col in cols_widths_fracts_ints]
-        extend_cols_widths(space_from_fracts)
-        self.usable_display_width = sum(self.cols_widths) + self.borders_space
+        ideal_widths = []
+        for i, col in enumerate(columns):
+            longest_word = max([len(w) for w in col.label.split()] or [0])
+            ideal_widths.append(max([longest_word] + [len(row[i]) for row in formatted]) + 1)
+
+        self.cols_widths = list(ideal_widths)
+        if sum(ideal_widths) > available:
+            # Table does not fit. Columns with declared width get their share
+            # of the terminal, the rest is split between remaining columns,
+            # narrowest first, so that short columns are not wrapped.
+            auto = []
+            remaining = available
+            for i, col in enumerate(columns):
+                if col.width:
+                    self.cols_widths[i] = int(available * col.width / 100)
+                    remaining -= self.cols_widths[i]
+                else:
+                    auto.append(i)
+
+            for n, i in enumerate(sorted(auto, key=lambda i: ideal_widths[i])):
+                share = int(remaining / (len(auto) - n))
+                self.cols_widths[i] = max(min(ideal_widths[i], share), 1)
+                remaining -= self.cols_widths[i]
+
+        # Width left unused is handed out in proportion to the sample widths,
+        # so that values longer than the ones sampled are not wrapped needlessly
+        spare = available - sum(self.cols_widths)
+        if spare > 0 and columns:
+            extra = [int(spare * w / sum(ideal_widths)) for w in ideal_widths]
+            widest = sorted(range(len(columns)), key=lambda i: ideal_widths[i], reverse=True)
+            for i in widest[:spare - sum(extra)]:
+                extra[i] += 1
+
+            self.cols_widths = [w + e for w, e in zip(self.cols_widths, extra)]
 
-    def _load_accessors(self, columns):
-        self.accessors = [col.accessor for col in columns]
+        self.usable_display_width = sum(self.cols_widths) + self.borders_space
 
     def _load_value_types(self, columns):
         self.value_types = [col.vt for col in columns]
@@ -379,25 +414,25 @@ class AsciiStreamTablePrinter(object):
         self.ordered_line_elements = [col.label for col in columns]
         self.ordered_lines_elements = [self.ordered_line_elements]
 
-    def _load_row_elements(self, row, conv2ascii=False):
+    def _format_row_elements(self, row, conv2ascii=False):
 
         def convert_nested_dict_to_string(dict):
             return ", ".join([":".join([k, v]) for k, v in dict.items()])
 
-        for i, acc in enumerate(self.accessors):
-            if callable(acc):
-                elem = acc(row)
-            else:
-                elem = row[acc]
-
+        elements = []
+        for i, elem in enumerate(row):
             if isinstance(elem, dict):
                 elem = convert_nested_dict_to_string(elem)
 
             if conv2ascii and isinstance(elem, str):
                 elem = ascii(elem) if not _is_ascii(elem) else elem
 
-            self.ordered_line_elements.append(AsciiOutputFormatter.format_value(elem, self.value_types[i]))
+            elements.append(str(AsciiOutputFormatter.format_value(elem, self.value_types[i])))
+
+        return elements
 
+    def _load_row_elements(self, row, conv2ascii=False, elements=None):
+        self.ordered_line_elements = list(elements) if elements is not None else self._format_row_elements(row, conv2ascii)
         self.ordered_lines_elements = [self.ordered_line_elements]
 
     def _trim_elements(self):
@@ -483,6 +518,7 @@ class AsciiStreamTablePrinter(object):
     def _print_lines(self, file, end):
         for line in self.ordered_lines:
             six.print_(line, file=file, end=end)
+        self.lines_printed += len(self.ordered_lines)
         self._cleanup_lines()
 
 
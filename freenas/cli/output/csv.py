@@ -0,0 +1,128 @@
+#+
+# Copyright 2015 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import csv
+import six
+import sys
+from freenas.dispatcher.jsonenc import dumps
+from freenas.cli.output import ValueType, resolve_cell
+
+
+class CsvOutputFormatter(object):
+    dialect = 'excel'
+
+    @staticmethod
+    def format_value(value, vt):
+        if value is None:
+            return ''
+
+        if vt == ValueType.BOOLEAN:
+            return 'true' if value else 'false'
+
+        if vt in (ValueType.SET, ValueType.ARRAY):
+            return ','.join(str(i) for i in value)
+
+        if vt == ValueType.DICT:
+            return dumps(value)
+
+        if vt == ValueType.TEXT_FILE:
+            return str(value[:10] + '(...)')
+
+        if vt == ValueType.HEXNUMBER:
+            return hex(value)
+
+        if vt == ValueType.OCTNUMBER:
+            return oct(value)
+
+        if vt == ValueType.PERMISSIONS:
+            return oct(value['value'])
+
+        if vt == ValueType.DATE:
+            return '{:%Y-%m-%d %H:%M:%S}'.format(value)
+
+        if vt == ValueType.PASSWORD:
+            return '*****'
+
+        return str(value)
+
+    @classmethod
+    def writer(cls, file=None):
+        return csv.writer(file or sys.stdout, dialect=cls.dialect, lineterminator='\n')
+
+    @classmethod
+    def output_list(cls, data, label, vt=ValueType.STRING, **kwargs):
+        writer = cls.writer(kwargs.get('file'))
+        writer.writerow([label])
+        for i in data:
+            writer.writerow([cls.format_value(i, vt)])
+
+    @classmethod
+    def output_dict(cls, data, key_label, value_label, value_vt=ValueType.STRING):
+        writer = cls.writer()
+        writer.writerow([key_label, value_label])
+        for k, v in data.items():
+            writer.writerow([k, cls.format_value(v, value_vt)])
+
+    @classmethod
+    def output_table(cls, tab, file=None, **kwargs):
+        # Rows are written as they are resolved, so memory use does not
+        # grow with the size of the table
+        writer = cls.writer(file)
+        writer.writerow([col.label for col in tab.columns])
+        for row in tab.formatted_rows(cls, cache=False):
+            writer.writerow(row)
+
+    @classmethod
+    def output_object(cls, obj, file=None, **kwargs):
+        writer = cls.writer(file)
+        writer.writerow(['Property', 'Description', 'Value'])
+        for item in obj:
+            writer.writerow([item.name, item.descr, cls.format_value(item.value, item.vt)])
+
+    @classmethod
+    def output_tree(cls, tree, children, label, label_vt=ValueType.STRING, file=None):
+        def branch(obj):
+            for i in obj:
+                writer.writerow([cls.format_value(resolve_cell(i, label), label_vt)])
+                subtree = resolve_cell(i, children)
+                if subtree:
+                    branch(subtree)
+
+        writer = cls.writer(file)
+        branch(tree)
+
+    @staticmethod
+    def output_msg(message, **kwargs):
+        six.print_(
+            '' if message is None else message,
+            end=('\n' if kwargs.get('newline', True) else ' '),
+            file=kwargs.pop('file', sys.stdout)
+        )
+
+
+def _formatter():
+    return CsvOutputFormatter
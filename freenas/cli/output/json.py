@@ -26,8 +26,15 @@
 #####################################################################
 
 import six
+import sys
+import textwrap
 from freenas.dispatcher.jsonenc import dumps
-from freenas.cli.output import ValueType, resolve_cell
+from freenas.cli import config
+from freenas.cli.output import ValueType
+
+
+def get_indent():
+    return None if config.instance.variables.get('json_compact') else 4
 
 
 class JsonOutputFormatter(object):
@@ -64,37 +71,46 @@ class JsonOutputFormatter(object):
 
     @staticmethod
     def output_list(data, label):
-        six.print_(dumps(list(data), indent=4))
+        six.print_(dumps(list(data), indent=get_indent()))
 
     @staticmethod
     def output_dict(data, key_label, value_label):
-        six.print_(dumps(dict(data), indent=4))
+        six.print_(dumps(dict(data), indent=get_indent()))
 
     @staticmethod
-    def output_table(table):
-        output = []
-        for row in table.data:
-            rowdata = {}
-            for col in table.columns:
-                rowdata[col.label] = JsonOutputFormatter.format_value(resolve_cell(row, col.accessor), col.vt)
-            output.append(rowdata)
-
-        six.print_(dumps(output, indent=4))
+    def output_table(table, file=None, **kwargs):
+        # Array items are written as they are resolved instead of dumping
+        # the whole table at once
+        file = file or sys.stdout
+        labels = [col.label for col in table.columns]
+        indent = get_indent()
+        count = 0
+        file.write('[')
+        for row in table.formatted_rows(JsonOutputFormatter, cache=False):
+            item = dumps(dict(zip(labels, row)), indent=indent)
+            if indent:
+                file.write(('\n' if count == 0 else ',\n') + textwrap.indent(item, ' ' * indent))
+            else:
+                file.write(item if count == 0 else ', ' + item)
+
+            count += 1
+
+        file.write('\n]\n' if indent and count else ']\n')
 
     @staticmethod
     def output_tree(data, children, label):
-        six.print_(dumps(list(data), indent=4))
+        six.print_(dumps(list(data), indent=get_indent()))
 
     @staticmethod
     def output_msg(data, **kwargs):
-        six.print_(dumps(data, indent=4))
+        six.print_(dumps(data, indent=get_indent()))
 
     @staticmethod
     def output_object(obj):
         output = {}
         for item in obj:
             output[item.name] = JsonOutputFormatter.format_value(item.value, item.vt)
-        six.print_(dumps(output, indent=4))
+        six.print_(dumps(output, indent=get_indent()))
 
 
 def _formatter():
@@ -0,0 +1,73 @@
+#+
+# Copyright 2015 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import six
+import sys
+from freenas.dispatcher.jsonenc import dumps
+from freenas.cli.output.json import JsonOutputFormatter
+
+
+class NdjsonOutputFormatter(JsonOutputFormatter):
+    """
+    Newline delimited JSON: every list item and table row is written as
+    a separate single line document as soon as it is resolved.
+    """
+    @staticmethod
+    def output_list(data, label):
+        for i in data:
+            six.print_(dumps(i))
+
+    @staticmethod
+    def output_dict(data, key_label, value_label):
+        six.print_(dumps(dict(data)))
+
+    @staticmethod
+    def output_table(table, file=None, **kwargs):
+        file = file or sys.stdout
+        labels = [col.label for col in table.columns]
+        for row in table.formatted_rows(JsonOutputFormatter, cache=False):
+            file.write(dumps(dict(zip(labels, row))) + '\n')
+
+    @staticmethod
+    def output_tree(data, children, label):
+        for i in data:
+            six.print_(dumps(i))
+
+    @staticmethod
+    def output_msg(data, **kwargs):
+        six.print_(dumps(data))
+
+    @staticmethod
+    def output_object(obj):
+        output = {}
+        for item in obj:
+            output[item.name] = JsonOutputFormatter.format_value(item.value, item.vt)
+        six.print_(dumps(output))
+
+
+def _formatter():
+    return NdjsonOutputFormatter
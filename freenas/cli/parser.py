@@ -89,17 +89,28 @@ def ASTObject(name, *args):
                     'value': LITERAL_TYPES_REVERSED[value]
                 }
 
+            if isinstance(value, list):
+                return [to_json_fragment(i) for i in value]
+
+            if isinstance(value, tuple):
+                return {
+                    'ast_object_type': 'TupleValue',
+                    'value': [to_json_fragment(i) for i in value]
+                }
+
+            if isinstance(value, dict):
+                return {
+                    'ast_object_type': 'DictValue',
+                    'value': [[to_json_fragment(k), to_json_fragment(v)] for k, v in value.items()]
+                }
+
             return value
 
         for i in self.args_list:
-            value = getattr(self, i)
-
-            if isinstance(value, list):
-                value = [to_json_fragment(i) for i in value]
-            else:
-                value = to_json_fragment(value)
+            ret[i] = to_json_fragment(getattr(self, i))
 
-            ret[i] = value
+        if getattr(self, 'line', None) is not None:
+            ret['position'] = [self.file, self.line, self.column, self.column_end]
 
         return ret
 
@@ -132,6 +143,7 @@ AssignmentStatement = ASTObject('AssignmentStatement', 'name', 'expr')
 ConstStatement = ASTObject('ConstStatement', 'name', 'expr')
 ForStatement = ASTObject('ForStatement', 'stmt1', 'expr', 'stmt2', 'body')
 ForInStatement = ASTObject('ForInStatement', 'var', 'expr', 'body')
+ParallelForStatement = ASTObject('ParallelForStatement', 'var', 'expr', 'body', 'options')
 WhileStatement = ASTObject('WhileStatement', 'expr', 'body')
 UndefStatement = ASTObject('UndefStatement', 'name')
 AssertStatement = ASTObject('AssertStatement', 'expr', 'msg')
@@ -148,6 +160,7 @@ reserved = {
     'if': 'IF',
     'else': 'ELSE',
     'for': 'FOR',
+    'parallel': 'PARALLEL',
     'while': 'WHILE',
     'in': 'IN',
     'function': 'FUNCTION',
@@ -502,6 +515,7 @@ def p_stmt(p):
     stmt : if_stmt
     stmt : for_stmt
     stmt : for_in_stmt
+    stmt : parallel_for_stmt
     stmt : while_stmt
     stmt : assignment_stmt
     stmt : function_definition_stmt
@@ -564,6 +578,39 @@ def p_for_in_stmt_2(p):
     p[0] = ForInStatement((p[3], p[5]), p[7], p[9], p=p)
 
 
+def p_parallel_for_stmt_1(p):
+    """
+    parallel_for_stmt : PARALLEL for_in_stmt
+    """
+    p[0] = ParallelForStatement(p[2].var, p[2].expr, p[2].body, [], p=p)
+
+
+def p_parallel_for_stmt_2(p):
+    """
+    parallel_for_stmt : PARALLEL LPAREN parallel_option_list RPAREN for_in_stmt
+    """
+    p[0] = ParallelForStatement(p[5].var, p[5].expr, p[5].body, p[3], p=p)
+
+
+def p_parallel_option_list(p):
+    """
+    parallel_option_list : parallel_option
+    parallel_option_list : parallel_option COMMA parallel_option_list
+    """
+    if len(p) == 2:
+        p[0] = [p[1]]
+        return
+
+    p[0] = [p[1]] + p[3]
+
+
+def p_parallel_option(p):
+    """
+    parallel_option : ATOM ASSIGN expr
+    """
+    p[0] = (p[1], p[3])
+
+
 def p_while_stmt(p):
     """
     while_stmt : WHILE LPAREN expr RPAREN block
@@ -1233,6 +1280,14 @@ def unparse(token, indent=0, oneliner=False):
             format_block(token.body)
         ))
 
+    if isinstance(token, ParallelForStatement):
+        return ind('parallel {0}for ({1} in {2}) {{{3}}}'.format(
+            '({0}) '.format(', '.join('{0}={1}'.format(k, unparse(v)) for k, v in token.options)) if token.options else '',
+            token.var if not isinstance(token.var, tuple) else ', '.join(token.var),
+            unparse(token.expr),
+            format_block(token.body)
+        ))
+
     if isinstance(token, WhileStatement):
         return ind('while ({0}) {{{1}}}'.format(
             unparse(token.expr),
@@ -1273,12 +1328,22 @@ def read_ast(value):
         if type == 'TypeReference':
             return LITERAL_TYPES[value['value']]
 
+        if type == 'TupleValue':
+            return tuple(read_ast(i) for i in value['value'])
+
+        if type == 'DictValue':
+            return {read_ast(k): read_ast(v) for k, v in value['value']}
+
         type = globals()[type]
         args = []
         for i in type.args_list:
             args.append(read_ast(value[i]))
 
-        return type(*args)
+        ret = type(*args)
+        if 'position' in value:
+            ret.file, ret.line, ret.column, ret.column_end = value['position']
+
+        return ret
 
     return value
 
@@ -212,10 +212,10 @@ class AlertNamespace(EntitySubscriberBasedLoadMixin, EntityNamespace):
             'dismiss_all': DismissAllAlertsCommand()
         }
 
-    def namespaces(self):
+    def namespaces(self, entities=True):
         yield AlertFilterNamespace('filter', self.context)
         yield AlertEmitterNamespace('emitter', self.context)
-        for ns in super(AlertNamespace, self).namespaces():
+        for ns in super(AlertNamespace, self).namespaces(entities=entities):
             yield ns
 
     def serialize(self):
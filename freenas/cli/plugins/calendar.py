@@ -109,7 +109,7 @@ class CalendarTasksNamespace(EntitySubscriberBasedLoadMixin, EntityNamespace):
 
         self.primary_key = self.get_mapping('name')
 
-    def namespaces(self):
+    def namespaces(self, entities=True):
         return [
             ScrubNamespace('scrub', self.context),
             RsyncNamespace('rsync', self.context),
@@ -369,8 +369,8 @@ class DisksNamespace(EntitySubscriberBasedLoadMixin, TaskBasedSaveMixin, EntityN
 
         return 'unknown'
 
-    def namespaces(self, name=None):
-        return list(super(DisksNamespace, self).namespaces()) + [
+    def namespaces(self, name=None, entities=True):
+        return list(super(DisksNamespace, self).namespaces(entities=entities)) + [
             EnclosureNamespace('enclosure', self.context),
             ISCSINamespace('iscsi', self.context)
         ]
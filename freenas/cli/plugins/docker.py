@@ -28,12 +28,11 @@
 import gettext
 from freenas.cli.namespace import (
     Namespace, EntityNamespace, Command, EntitySubscriberBasedLoadMixin,
-    TaskBasedSaveMixin, CommandException, description, ConfigNamespace, RpcBasedLoadMixin
+    TaskBasedSaveMixin, CommandException, description, ConfigNamespace, RpcBasedLoadMixin, Relation
 )
 from freenas.cli.output import ValueType, Table, Sequence, read_value
 from freenas.cli.utils import (
-    TaskPromise, post_save, EntityPromise, get_item_stub, objname2id, objid2name, set_name, check_name,
-    get_related, set_related
+    TaskPromise, post_save, EntityPromise, get_item_stub, objname2id, set_name, check_name
 )
 from freenas.utils import query as q
 from freenas.cli.complete import NullComplete, EntitySubscriberComplete, EnumComplete
@@ -99,8 +98,8 @@ class DockerHostNamespace(EntitySubscriberBasedLoadMixin, TaskBasedSaveMixin, En
         self.add_property(
             descr='Datastore',
             name='datastore',
-            get=lambda o: get_related(self.context, 'vm.datastore', o, 'target'),
-            set=lambda o, v: set_related(self.context, 'vm.datastore', o, 'target', v),
+            get='target',
+            relation=Relation('vm.datastore'),
             createsetable=True,
             usersetable=False,
             complete=EntitySubscriberComplete('datastore=', 'vm.datastore', lambda i: i['name']),
@@ -267,8 +266,9 @@ class DockerNetworkNamespace(EntitySubscriberBasedLoadMixin, TaskBasedSaveMixin,
         self.add_property(
             descr='Containers',
             name='containers',
-            get=lambda o: [objid2name(self.context, 'docker.container', id) for id in o.get('containers')],
+            get='containers',
             set=self.set_containers,
+            relation=Relation('docker.container'),
             usage=_("""\
             List of containers connected to the network.
             """),
@@ -525,8 +525,9 @@ class DockerContainerNamespace(EntitySubscriberBasedLoadMixin, TaskBasedSaveMixi
         self.add_property(
             descr='Host',
             name='host',
-            get=lambda o: objid2name(context, 'docker.host', o['host']),
+            get='host',
             set=None,
+            relation=Relation('docker.host'),
             list=True,
             complete=EntitySubscriberComplete('host=', 'docker.host', lambda d: d['name']),
             usage=_('''\
@@ -706,8 +707,9 @@ class DockerContainerNamespace(EntitySubscriberBasedLoadMixin, TaskBasedSaveMixi
         self.add_property(
             descr='Docker networks',
             name='networks',
-            get=lambda o: [objid2name(self.context, 'docker.network', id) for id in o.get('networks')],
+            get='networks',
             set=self.set_networks,
+            relation=Relation('docker.network'),
             usersetable=False,
             usage=_("""\
             List of docker networks the container is connected to.
@@ -869,8 +871,8 @@ class DockerConfigNamespace(ConfigNamespace):
         self.add_property(
             descr='Default Docker host',
             name='default_host',
-            get=lambda o: objid2name(context, 'docker.host', o['default_host']),
-            set=lambda o, v: q.set(o, 'default_host', objname2id(context, 'docker.host', v)),
+            get='default_host',
+            relation=Relation('docker.host'),
             complete=EntitySubscriberComplete('default_host=', 'docker.host', lambda d: d['name']),
             usage=_('''\
             Name of a Docker host selected by default for any
@@ -881,8 +883,8 @@ class DockerConfigNamespace(ConfigNamespace):
         self.add_property(
             descr='Forward Docker remote API to host',
             name='api_forwarding',
-            get=lambda o: objid2name(context, 'docker.host', o['api_forwarding']),
-            set=lambda o, v: q.set(o, 'api_forwarding', objname2id(context, 'docker.host', v)),
+            get='api_forwarding',
+            relation=Relation('docker.host'),
             complete=EntitySubscriberComplete('api_forwarding=', 'docker.host', lambda d: d['name']),
             usage=_('''\
             Defines which (if any) Docker host - Virtual Machine hosting
@@ -1035,11 +1035,11 @@ class IPMINamespace(RpcBasedLoadMixin, EntityNamespace):
             callback=lambda s, t: post_save(this, s, t)
         )
 
-    def namespaces(self):
+    def namespaces(self, entities=True):
         if getattr(self, 'is_docgen_instance', False):
             return []
         else:
-            return super(IPMINamespace, self).namespaces()
+            return super(IPMINamespace, self).namespaces(entities=entities)
 
 
 @description("Configure networking")
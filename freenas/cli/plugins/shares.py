@@ -175,7 +175,7 @@ class SharesNamespace(EntitySubscriberBasedLoadMixin, EntityNamespace):
             'show': ListCommand(self),
         }
 
-    def namespaces(self):
+    def namespaces(self, entities=True):
         return [
             NFSSharesNamespace('nfs', self.context),
             AFPSharesNamespace('afp', self.context),
@@ -1442,8 +1442,8 @@ class ISCSISharesNamespace(BaseSharesNamespace):
             enum=['UNKNOWN', 'SSD', '5400', '7200', '10000', '15000']
         )
 
-    def namespaces(self):
-        return list(super(ISCSISharesNamespace, self).namespaces()) + [
+    def namespaces(self, entities=True):
+        return list(super(ISCSISharesNamespace, self).namespaces(entities=entities)) + [
             ISCSIPortalsNamespace('portals', self.context),
             ISCSITargetsNamespace('targets', self.context),
             ISCSIAuthGroupsNamespace('auth', self.context)
@@ -25,11 +25,13 @@
 #
 #####################################################################
 
+import copy
 import gettext
 from freenas.cli.output import ValueType, Object
 from freenas.cli.namespace import EntityNamespace, EntitySubscriberBasedLoadMixin, Command, BaseListCommand, description
 from freenas.cli.complete import NullComplete
 from freenas.cli.utils import TaskPromise, describe_task_state
+from freenas.utils import query as q
 from freenas.utils.query import get
 
 
@@ -273,6 +275,30 @@ class TasksNamespace(EntitySubscriberBasedLoadMixin, EntityNamespace):
             'show': TaskListCommand(self)
         }
 
+    def generic_query(self):
+        return True
+
+    def query(self, params, options):
+        history = self.context.task_history
+        if history is None or self.context.docgen_run:
+            return super(TasksNamespace, self).query(params, options)
+
+        # Running tasks come from the task subscriber, the ones which
+        # ended from the local task history
+        self.context.sync_task_history()
+        running = list(self.context.entity_subscribers['task'].query(*params))
+        ids = set(t['id'] for t in running)
+        tasks = running + [t for t in history.query(*params) if t['id'] not in ids]
+        options['sort'] = [self.default_sort]
+        return q.query(tasks, **options)
+
+    def get_one(self, name):
+        task = super(TasksNamespace, self).get_one(name)
+        if task is None and self.context.task_history is not None:
+            task = copy.deepcopy(self.context.task_history.get(name))
+
+        return task
+
     def serialize(self):
         raise NotImplementedError()
 
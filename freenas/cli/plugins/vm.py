@@ -29,10 +29,10 @@ import gettext
 from freenas.cli.output import Sequence, Table
 from freenas.cli.namespace import (
     EntityNamespace, Command, NestedObjectLoadMixin, NestedObjectSaveMixin, EntitySubscriberBasedLoadMixin,
-    TaskBasedSaveMixin, description, CommandException, ConfigNamespace, BaseVariantMixin, Namespace
+    TaskBasedSaveMixin, description, CommandException, ConfigNamespace, BaseVariantMixin, Namespace, Relation
 )
 from freenas.cli.output import Object, ValueType, get_humanized_size
-from freenas.cli.utils import TaskPromise, post_save, EntityPromise, get_item_stub, get_related, set_related
+from freenas.cli.utils import TaskPromise, post_save, EntityPromise, get_item_stub
 from freenas.utils import first_or_default
 from freenas.utils.query import get, set
 from freenas.cli.complete import NullComplete, EntitySubscriberComplete, RpcComplete, MultipleSourceComplete
@@ -455,8 +455,8 @@ class VMNamespace(TaskBasedSaveMixin, EntitySubscriberBasedLoadMixin, EntityName
         self.add_property(
             descr='Datastore',
             name='datastore',
-            get=lambda o: get_related(self.context, 'vm.datastore', o, 'target'),
-            set=lambda o, v: set_related(self.context, 'vm.datastore', o, 'target', v),
+            get='target',
+            relation=Relation('vm.datastore'),
             createsetable=True,
             usersetable=False,
             complete=EntitySubscriberComplete('datastore=', 'vm.datastore', lambda i: i['name']),
@@ -654,12 +654,12 @@ class VMNamespace(TaskBasedSaveMixin, EntitySubscriberBasedLoadMixin, EntityName
             'import': ImportVMCommand(self)
         }
 
-    def namespaces(self):
+    def namespaces(self, entities=True):
         yield TemplateNamespace('template', self.context)
         yield VMDatastoreNamespace('datastore', self.context)
         yield VMConfigNamespace('config', self.context)
         yield VMSCSIPortsNamespace('scsi_port', self.context)
-        for namespace in super(VMNamespace, self).namespaces():
+        for namespace in super(VMNamespace, self).namespaces(entities=entities):
             yield namespace
 
     def get_entity_namespaces(self, this):
@@ -1803,8 +1803,8 @@ class VMSCSILunsNamespace(NestedObjectSaveMixin, NestedObjectLoadMixin, EntityNa
         self.add_property(
             descr='Share name',
             name='name',
-            get=lambda o: get_related(self.context, 'share', o, 'lun_id'),
-            set=lambda o, v: set_related(self.context, 'share', o, 'lun_id', v)
+            get='lun_id',
+            relation=Relation('share')
         )
 
         self.primary_key = self.get_mapping('number')
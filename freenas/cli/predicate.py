@@ -0,0 +1,123 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import re
+import fnmatch
+
+
+def regex_match(value, regex):
+    return value is not None and regex.search(str(value)) is not None
+
+
+OPERATORS = {
+    '=': lambda x, y: x == y,
+    '!=': lambda x, y: x != y,
+    '>': lambda x, y: x > y,
+    '<': lambda x, y: x < y,
+    '>=': lambda x, y: x >= y,
+    '<=': lambda x, y: x <= y,
+    '~': regex_match,
+    'in': lambda x, y: x in y,
+    'nin': lambda x, y: x not in y,
+    'contains': lambda x, y: y in x,
+    'ncontains': lambda x, y: y not in x,
+    'match': lambda x, y: fnmatch.fnmatch(str(x), y)
+}
+
+ALIASES = {
+    '==': '=',
+    '~=': '~',
+    'rin': 'contains',
+    'rnin': 'ncontains'
+}
+
+CONJUNCTIONS = {
+    'and': all,
+    'or': any,
+    'nor': lambda results: not any(results)
+}
+
+
+def compile_term(accessor, op, value):
+    op = ALIASES.get(op, op)
+    fn = OPERATORS.get(op)
+    if not fn:
+        raise ValueError('Unknown operator {0}'.format(op))
+
+    if op == '~':
+        value = re.compile(value)
+
+    def term(item):
+        try:
+            return bool(fn(accessor(item), value))
+        except TypeError:
+            # Mismatched types (e.g. comparing None with a number) never match
+            return False
+
+    return term
+
+
+def compile_predicate(expr, accessor):
+    """
+    Compiles a filter expression of the dispatcher query language - a list
+    of ``(field, op, value)`` terms and ``(conjunction, [terms])`` groups,
+    all of which have to hold - into a function of a single item.
+    ``accessor(field)`` should return a function extracting field value
+    from an item. Field accessors and regexes are resolved once, here.
+    """
+    terms = []
+    for i in expr:
+        if len(i) == 2:
+            conj, sub = i
+            if conj not in CONJUNCTIONS:
+                raise ValueError('Unknown conjunction {0}'.format(conj))
+
+            subterms = [compile_predicate([s], accessor) for s in sub]
+            terms.append(lambda item, c=CONJUNCTIONS[conj], s=subterms: c(t(item) for t in s))
+            continue
+
+        if len(i) == 3:
+            field, op, value = i
+            terms.append(compile_term(accessor(field), op, value))
+            continue
+
+        raise ValueError('Invalid filter term {0}'.format(i))
+
+    if len(terms) == 1:
+        return terms[0]
+
+    return lambda item: all(t(item) for t in terms)
+
+
+def filter_items(items, expr, accessor):
+    """
+    Returns a lazy iterator over items matching given filter expression.
+    The expression is compiled right away, so that errors in it are raised
+    here rather than when the result is first consumed.
+    """
+    predicate = compile_predicate(expr, accessor)
+    return (i for i in items if predicate(i))
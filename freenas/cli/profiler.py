@@ -0,0 +1,155 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+
+import time
+import cProfile
+import threading
+import contextlib
+import collections
+from freenas.cli import config
+from freenas.cli.output import Table, ValueType
+
+
+class Phase(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.elapsed = 0.0
+        self.children = collections.OrderedDict()
+
+    def child(self, name):
+        ret = self.children.get(name)
+        if ret is None:
+            ret = self.children[name] = Phase(name)
+
+        return ret
+
+
+class Profiler(object):
+    """
+    Collects hierarchical wall-clock timings of CLI phases and of every
+    RPC call issued while it is installed. Optionally runs cProfile
+    alongside and dumps pstats data to a file.
+    """
+    def __init__(self, context, dump=None):
+        self.context = context
+        self.dump = dump
+        self.root = Phase('total')
+        self.background = self.root.child('background')
+        self.stack = [self.root]
+        self.thread = threading.current_thread()
+        self.lock = threading.Lock()
+        self.cprofile = cProfile.Profile() if dump else None
+        self.started_at = None
+        self.orig_call_sync = None
+
+    def start(self):
+        self.started_at = time.time()
+        self.orig_call_sync = self.context.connection.call_sync
+        self.context.connection.call_sync = self.call_sync
+        self.context.profiler = self
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+
+        self.root.calls = 1
+        self.root.elapsed = time.time() - self.started_at
+        self.context.connection.call_sync = self.orig_call_sync
+        self.context.profiler = None
+
+        # Profiler is uninstalled by now even if the dump cannot be saved
+        if self.cprofile:
+            self.cprofile.dump_stats(self.dump)
+
+    def current(self):
+        if threading.current_thread() is self.thread:
+            return self.stack[-1]
+
+        return self.background
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if threading.current_thread() is not self.thread:
+            yield
+            return
+
+        node = self.stack[-1].child(name)
+        self.stack.append(node)
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            node.calls += 1
+            node.elapsed += time.time() - started_at
+            self.stack.pop()
+
+    def call_sync(self, name, *args, **kwargs):
+        started_at = time.time()
+        try:
+            return self.orig_call_sync(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - started_at
+            with self.lock:
+                node = self.current().child('rpc {0}'.format(name))
+                node.calls += 1
+                node.elapsed += elapsed
+
+    def report(self):
+        def walk(node, depth):
+            yield {
+                'phase': '  ' * depth + node.name,
+                'calls': node.calls,
+                'time': '{0:.4f}s'.format(node.elapsed),
+                'percent': '{0:.1f}%'.format(node.elapsed / total * 100) if total else None
+            }
+
+            for i in node.children.values():
+                if i.calls:
+                    yield from walk(i, depth + 1)
+
+        total = self.root.elapsed
+        return Table(list(walk(self.root, 0)), [
+            Table.Column('Phase', 'phase'),
+            Table.Column('Calls', 'calls', ValueType.NUMBER),
+            Table.Column('Time', 'time'),
+            Table.Column('Share', 'percent')
+        ])
+
+
+@contextlib.contextmanager
+def phase(name):
+    profiler = getattr(config.instance, 'profiler', None)
+    if profiler is None:
+        yield
+        return
+
+    with profiler.phase(name):
+        yield
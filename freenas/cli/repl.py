@@ -26,7 +26,6 @@
 #
 #####################################################################
 
-import copy
 import enum
 import sys
 import os
@@ -48,27 +47,37 @@ import inspect
 import re
 import contextlib
 import rollbar
+import atexit
 from six.moves.urllib.parse import urlparse
 from socket import gaierror as socket_error
 from freenas.cli.output import Table
 from freenas.cli.descriptions import events
-from freenas.cli.utils import SIGTSTPException, SIGTSTP_setter, errors_by_path, quote, flatten_table
+from freenas.cli.utils import (
+    SIGTSTPException, SIGTSTP_setter, errors_by_path, quote, flatten_table, EntityIndex, run_parallel
+)
 from freenas.cli import functions
 from freenas.cli import config
 from freenas.cli.namespace import (
     Namespace, EntityNamespace, RootNamespace, SingleItemNamespace, ConfigNamespace, Command,
-    FilteringCommand, PipeCommand, CommandException
+    FilteringCommand, PipeCommand, CommandException, LazyNamespace, EntitySubscriberBasedLoadMixin
 )
+from freenas.cli.manifest import load_manifest, generate_manifest, file_digest
+from freenas.cli.cache import EntityCache, CachedEntitySubscriber
+from freenas.cli.notifications import NotificationQueue
+from freenas.cli.taskgroup import TaskGroup, PendingTasks, FINAL_STATES
+from freenas.cli.history import TaskHistory
+from freenas.cli.script import load_script
+from freenas.cli.profiler import Profiler, phase as profile_phase
 from freenas.cli.parser import (
     parse, unparse, Symbol, Literal, BinaryParameter, UnaryExpr, BinaryExpr, PipeExpr, AssignmentStatement,
     IfStatement, ForStatement, ForInStatement, WhileStatement, FunctionCall, CommandCall, Subscript,
     ExpressionExpansion, CommandExpansion, SyncCommandExpansion, FunctionDefinition, ReturnStatement,
     BreakStatement, UndefStatement, AssertStatement, Redirection, AnonymousFunction, ShellEscape,
-    Parentheses, ConstStatement, Quote
+    Parentheses, ConstStatement, Quote, ParallelForStatement
 )
 from freenas.cli.output import (
-    ValueType, ProgressBar, output_lock, output_msg, read_value, format_value,
-    format_output, output_msg_locked
+    ValueType, TaskProgressView, output_lock, output_msg, read_value, format_value,
+    format_output, output_msg_locked, output_formats, register_formatter, Sequence
 )
 from freenas.dispatcher.client import Client, ClientError
 from freenas.dispatcher.entity import EntitySubscriber
@@ -83,7 +92,9 @@ from freenas.cli.commands import (
     SelectPipeCommand, FindPipeCommand, LoginCommand, DumpCommand, WhoamiCommand, PendingCommand,
     WaitCommand, OlderThanPipeCommand, NewerThanPipeCommand, IndexCommand, AliasCommand,
     UnaliasCommand, ListVarsCommand, AttachDebuggerCommand,
-    WCommand, TimeCommand, RemoteCommand, BuiltinCommand
+    WCommand, TimeCommand, ProfileCommand, RemoteCommand, BuiltinCommand, SubscribersCommand, CacheCommand,
+    CountPipeCommand, SumPipeCommand, GroupByPipeCommand, UniqPipeCommand, TaskGroupCommand,
+    NotificationsCommand
 )
 from freenas.cli.docgen import CliDocGen
 
@@ -167,6 +178,13 @@ ENTITY_SUBSCRIBERS = [
     'docker.collection',
     'vmware.dataset'
 ]
+EAGER_ENTITY_SUBSCRIBERS = [
+    'task'
+]
+
+# Seconds tasks which ended are kept in the task subscriber, as someone
+# may still be waiting for them, before being served from task history
+TASK_HISTORY_TRIM_DELAY = 60
 
 
 def sort_args(args):
@@ -223,13 +241,60 @@ def convert_to_literals(tokens):
             return Literal(t.name, str)
 
         if isinstance(t, BinaryParameter):
-            t.right = conv(t.right)
+            return BinaryParameter(t.left, t.op, conv(t.right))
 
         return t
 
     return [conv(i) for i in tokens]
 
 
+class EntitySubscriberStore(dict):
+    """
+    Holds entity subscribers of the current session. Subscribers which
+    are not running yet are started (and synced) on first access.
+    """
+    def __init__(self, context):
+        super(EntitySubscriberStore, self).__init__()
+        self.context = context
+        self.lock = threading.RLock()
+        self.materialized = collections.OrderedDict()
+        self.indexes = {}
+
+    def __missing__(self, name):
+        if name not in ENTITY_SUBSCRIBERS or self.context.session_id is None:
+            raise KeyError(name)
+
+        with self.lock:
+            if name in self:
+                return dict.__getitem__(self, name)
+
+            return self.context.start_entity_subscriber(name)
+
+    def index(self, name, field):
+        """
+        Returns a hash index of given subscriber's items on given field.
+        """
+        subscriber = self[name]
+        subscriber.wait_ready()
+
+        with self.lock:
+            # Subscribers are recreated after reconnecting, so are indexes
+            index = self.indexes.get((name, field))
+            if index is None or index.subscriber is not subscriber:
+                index = self.indexes[(name, field)] = EntityIndex(subscriber, field)
+
+            return index
+
+    def stop_all(self):
+        with self.lock:
+            for i in self.values():
+                i.stop()
+
+            self.clear()
+            self.materialized.clear()
+            self.indexes.clear()
+
+
 class FlowControlInstructionType(enum.Enum):
     RETURN = 'RETURN'
     BREAK = 'BREAK'
@@ -264,37 +329,63 @@ class VariableStore(object):
     def __init__(self):
         self.save_to_file = DEFAULT_CLI_CONFIGFILE
         self.variables = {
-            'output_format': self.Variable('ascii', ValueType.STRING, ['ascii', 'json']),
+            'output_format': self.Variable('ascii', ValueType.STRING, output_formats),
+            'json_compact': self.Variable(False, ValueType.BOOLEAN),
             'datetime_format': self.Variable('natural', ValueType.STRING),
             'language': self.Variable(os.getenv('LANG', 'C'), ValueType.STRING),
             'prompt': self.Variable('{jobs_short}{host}:{path}>', ValueType.STRING),
             'timeout': self.Variable(10, ValueType.NUMBER),
             'tasks_blocking': self.Variable(False, ValueType.BOOLEAN),
+            'task_group_concurrency': self.Variable(16, ValueType.NUMBER),
+            'parallel_workers': self.Variable(8, ValueType.NUMBER),
+            'notify_interval': self.Variable(500, ValueType.NUMBER),
+            'notify_burst': self.Variable(10, ValueType.NUMBER),
             'show_events': self.Variable(True, ValueType.BOOLEAN),
             'debug': self.Variable(False, ValueType.BOOLEAN),
             'abort_on_errors': self.Variable(False, ValueType.BOOLEAN),
             'output': self.Variable(None, ValueType.STRING),
+            'table_sample_rows': self.Variable(100, ValueType.NUMBER),
+            'page_size': self.Variable(500, ValueType.NUMBER),
+            'interactive_paging': self.Variable(True, ValueType.BOOLEAN),
             'verbosity': self.Variable(1, ValueType.NUMBER),
             'rollbar_enabled': self.Variable(True, ValueType.BOOLEAN),
             'vm.console_interrupt': self.Variable(r'\035', ValueType.STRING),
+            'compiler': self.Variable(True, ValueType.BOOLEAN),
+            'entity_cache': self.Variable(False, ValueType.BOOLEAN),
+            'entity_cache_max_size': self.Variable(64 * 1024 * 1024, ValueType.SIZE),
+            'task_history': self.Variable(False, ValueType.BOOLEAN),
+            'task_history_size': self.Variable(10000, ValueType.NUMBER),
             'cli_src_path': self.Variable(
                 os.path.dirname(os.path.realpath(__file__)), ValueType.STRING, None, True
             )
         }
         self.variable_doc = {
-            'output_format': _('Console output format. Can be set to \'ascii\' or \'json\'.'),
+            'output_format': _('Console output format. Can be set to \'ascii\', \'json\', \'ndjson\' (one JSON document per line), \'csv\' or \'tsv\'.'),
+            'json_compact': _('Toggle printing JSON output without indentation. Can be set to yes or no.'),
             'datetime_format': _('Date and time format.'),
             'language': _('Display the console language.'),
             'prompt': _('Console prompt.'),
             'timeout': _('Console timeout period in minutes.'),
             'tasks_blocking': _('Toggle tasks blocking console output. Can be set to yes or no.'),
+            'task_group_concurrency': _('Maximum number of tasks of a task group running at once. Set to 0 for no limit.'),
+            'parallel_workers': _('Default number of iterations of a \'parallel for\' loop evaluated at once.'),
+            'notify_interval': _('Minimum time in milliseconds between printing task and event notifications. Set to 0 to print them right away.'),
+            'notify_burst': _('Maximum number of task state changes printed at once. Larger bursts are summarized in a single line, errors and warnings are always printed. Set to 0 to never summarize.'),
             'show_events': _('Toggle displaying of events. Can be set to yes or no.'),
             'debug': _('Toggle display of debug messages. Can be set to yes or no.'),
             'abort_on_errors': _('Can be set to yes or no. When set to yes, command execution will abort on command errors.'),
             'output': _('Either send all output to specified file or set to \'none\' to display output on the console.'),
+            'table_sample_rows': _('Number of leading rows used to size table columns. Remaining rows are printed as they come.'),
+            'page_size': _('Number of items fetched at once when listing large collections, such as snapshots or tasks.'),
+            'interactive_paging': _('Toggle pausing after every screen when listing large collections on a terminal. Can be set to yes or no.'),
             'verbosity': _('Increasing verbosity of event messages. Can be set from 1 to 5.'),
             'rollbar_enabled': _('Toggle rollbar error reporting. Can be set to yes or no.'),
             'vm.console_interrupt': _(r'Set the console interrupt key sequence for virtual machines with support for octal characters of the form \nnn. Default is ^] or octal 035.'),
+            'compiler': _('Toggle compiling loops and function bodies before running them. Can be set to yes or no.'),
+            'entity_cache': _('Toggle keeping entity collections on disk between sessions. Can be set to yes or no.'),
+            'entity_cache_max_size': _('Maximum size of the on-disk entity cache.'),
+            'task_history': _('Toggle keeping tasks which ended in a local history file, queried instead of the server. Ended tasks are then dropped from the task subscriber after a minute. Can be set to yes or no.'),
+            'task_history_size': _('Number of tasks kept in the local task history.'),
             'cli_src_path': _('The absolute path of the cli source code on this machine')
         }
 
@@ -373,6 +464,7 @@ class Context(object):
         self.plugin_dirs = []
         self.task_callbacks = {}
         self.plugins = {}
+        self.lazy_plugins = {}
         self.reverse_task_mappings = {}
         self.variables = VariableStore()
         self.root_ns = RootNamespace('')
@@ -382,21 +474,75 @@ class Context(object):
         self.output_queue = six.moves.queue.Queue()
         self.keepalive_timer = None
         self.argparse_parser = None
-        self.entity_subscribers = {}
-        self.call_stack = [CallStackEntry('<stdin>', [], '<stdin>', 1, 1)]
+        self.entity_subscribers = EntitySubscriberStore(self)
+        self.entity_cache = None
+        self.task_history = None
+        self.ended_tasks = collections.OrderedDict()
+        self.ended_tasks_lock = threading.Lock()
         self.builtin_operators = functions.operators
         self.builtin_functions = functions.functions
         self.global_env = Environment(self)
         self.user = None
-        self.pending_tasks = {}
+        self.pending_tasks = PendingTasks()
+        self.task_groups = collections.OrderedDict()
+        self.task_group = None
+        self.thread_state = threading.local()
+        self.call_stack = [CallStackEntry('<stdin>', [], '<stdin>', 1, 1)]
         self.session_id = None
         self.user_commands = []
         self.local_connection = False
+        self.profiler = None
         config.instance = self
 
         self.output_thread = threading.Thread(target=self.output_thread)
         self.output_thread.daemon = True
         self.output_thread.start()
+        self.notifications = NotificationQueue(self.output_queue, self.variables)
+
+    # State of the pipe being evaluated is kept per thread, as bodies
+    # of parallel loops are evaluated concurrently
+    @property
+    def pipe_cwd(self):
+        return getattr(self.thread_state, 'pipe_cwd', None)
+
+    @pipe_cwd.setter
+    def pipe_cwd(self, value):
+        self.thread_state.pipe_cwd = value
+
+    @property
+    def pipe_filtered(self):
+        return getattr(self.thread_state, 'pipe_filtered', False)
+
+    @pipe_filtered.setter
+    def pipe_filtered(self, value):
+        self.thread_state.pipe_filtered = value
+
+    @property
+    def call_stack(self):
+        stack = getattr(self.thread_state, 'call_stack', None)
+        if stack is None:
+            stack = self.thread_state.call_stack = []
+
+        return stack
+
+    @call_stack.setter
+    def call_stack(self, value):
+        self.thread_state.call_stack = value
+
+    @contextlib.contextmanager
+    def call_frame(self, entry):
+        # Frames are popped even if the call fails, so the stack as it was
+        # at the point of failure is kept on the exception for reporting
+        stack = self.call_stack
+        stack.append(entry)
+        try:
+            yield
+        except BaseException as err:
+            if getattr(err, 'call_stack', None) is None:
+                err.call_stack = list(stack)
+            raise
+        finally:
+            stack.pop()
 
     @property
     def is_interactive(self):
@@ -404,66 +550,106 @@ class Context(object):
 
     @property
     def pending_jobs(self):
-        return len(list(filter(
-            lambda t: t['parent'] is None and t['session'] == self.session_id,
-            self.pending_tasks.values()
-        )))
+        return self.pending_tasks.count(self.session_id)
 
     def start(self, password=None):
-        self.discover_plugins()
-        self.connect(password) if not self.docgen_run else None
+        with profile_phase('discover plugins'):
+            self.discover_plugins()
 
-    def start_entity_subscribers(self):
-        for i in ENTITY_SUBSCRIBERS:
-            if i in self.entity_subscribers:
-                self.entity_subscribers[i].stop()
-                del self.entity_subscribers[i]
+        if not self.docgen_run:
+            with profile_phase('connect'):
+                self.connect(password)
+
+    def start_entity_subscriber(self, name, wait=True):
+        started_at = time.time()
+        if self.entity_cache:
+            e = CachedEntitySubscriber(self.connection, name, self.entity_cache)
+        else:
+            e = EntitySubscriber(self.connection, name)
 
-            e = EntitySubscriber(self.connection, i)
+        with profile_phase('sync {0}'.format(name)):
             e.start()
-            self.entity_subscribers[i] = e
+            if wait:
+                e.wait_ready()
+
+        self.entity_subscribers[name] = e
+        self.entity_subscribers.materialized[name] = {
+            'started_at': started_at,
+            'sync_time': time.time() - started_at if wait else None
+        }
+
+        self.logger.debug(_("Started entity subscriber %s"), name)
+        return e
+
+    def start_entity_subscribers(self):
+        self.save_entity_cache()
+        self.entity_subscribers.stop_all()
+        self.entity_cache = None
+        if self.variables.get('entity_cache'):
+            self.entity_cache = EntityCache(
+                self.uri,
+                self.user,
+                self.variables.get('entity_cache_max_size')
+            )
+
+        self.task_history = None
+        self.ended_tasks.clear()
+        if self.variables.get('task_history'):
+            self.task_history = TaskHistory(
+                self.uri,
+                self.user,
+                self.variables.get('task_history_size')
+            )
+
+        for i in EAGER_ENTITY_SUBSCRIBERS:
+            self.start_entity_subscriber(i, wait=False)
 
         def update_task(task, old_task=None):
-            self.pending_tasks[task['id']] = task
+            self.pending_tasks.update(task)
+            if self.task_history is not None and task['state'] in FINAL_STATES:
+                self.task_history.append(task)
+                with self.ended_tasks_lock:
+                    self.ended_tasks[task['id']] = time.time()
+
+                self.trim_ended_tasks()
+
             descr = task['name']
 
             if task['description']:
                 descr = task['description']['message']
 
-            if task['state'] in ('FINISHED', 'FAILED', 'ABORTED'):
-                del self.pending_tasks[task['id']]
-
+            # State changes of a task replace each other until printed
             if self.variables.get('verbosity') > 1 and task['state'] in ('CREATED', 'FINISHED'):
-                self.output_queue.put(_(
+                self.notifications.put(_(
                     "Task #{0}: {1}: {2}".format(
                         task['id'],
                         descr,
                         task['state'].lower(),
                     )
-                ))
+                ), ('state', task['id']), task['state'].lower())
 
             if self.variables.get('verbosity') > 2 and task['state'] == 'WAITING':
-                self.output_queue.put(_(
+                self.notifications.put(_(
                     "Task #{0}: {1}: {2}".format(
                         task['id'],
                         descr,
                         task['state'].lower(),
                     )
-                ))
+                ), ('state', task['id']), 'waiting')
 
             if task['state'] == 'FAILED':
                 if self.variables.get('verbosity') > 0 and (not task['parent'] or self.variables.get('verbosity') > 1):
-                    self.output_queue.put(_(
+                    self.notifications.put(_(
                         "Task #{0} error: {1}".format(
                             task['id'],
                             task['error'].get('message', '') if task.get('error') else ''
                         )
-                    ))
+                    ), ('state', task['id']), 'failed')
 
                     self.print_validation_errors(task)
 
             if task['state'] == 'ABORTED':
-                self.output_queue.put(_("Task #{0} aborted".format(task['id'])))
+                self.notifications.put(_("Task #{0} aborted".format(task['id'])), ('state', task['id']), 'aborted')
 
             if task['id'] in self.task_callbacks:
                 self.handle_task_callback(task)
@@ -471,18 +657,77 @@ class Context(object):
             if old_task:
                 if len(task['warnings']) > len(old_task['warnings']) and self.variables.get('verbosity') > 0:
                     for i in task['warnings'][len(old_task['warnings']):]:
-                        self.output_queue.put(_("Task #{0}: {1}: warning: {2}".format(
+                        self.notifications.put(_("Task #{0}: {1}: warning: {2}".format(
                             task['id'],
                             descr,
                             i['message']
-                        )))
+                        )), kind='warnings')
 
         self.entity_subscribers['task'].on_add.add(update_task)
         self.entity_subscribers['task'].on_update.add(lambda o, n: update_task(n, o))
 
+    def trim_task_subscriber(self, tasks):
+        subscriber = self.entity_subscribers['task']
+        indexes = [i for (name, __), i in list(self.entity_subscribers.indexes.items()) if name == 'task']
+        for task in tasks:
+            subscriber.items.pop(task['id'], None)
+            for i in indexes:
+                i.remove(task)
+
+    def trim_ended_tasks(self):
+        cutoff = time.time() - TASK_HISTORY_TRIM_DELAY
+        expired = []
+        with self.ended_tasks_lock:
+            while self.ended_tasks:
+                tid, ended_at = next(iter(self.ended_tasks.items()))
+                if ended_at >= cutoff:
+                    break
+
+                self.ended_tasks.popitem(last=False)
+                expired.append(tid)
+
+        items = self.entity_subscribers['task'].items
+        self.trim_task_subscriber(
+            t for t in (items.get(tid) for tid in expired)
+            if t and t['state'] in FINAL_STATES
+        )
+
+    def sync_task_history(self):
+        """
+        Records tasks which ended into the task history and drops them
+        from the task subscriber, leaving it with running tasks only.
+        """
+        if self.task_history is None:
+            return
+
+        subscriber = self.entity_subscribers['task']
+        subscriber.wait_ready()
+        ended = [t for t in list(subscriber.items.values()) if t['state'] in FINAL_STATES]
+        self.task_history.extend(ended)
+
+        # Tasks seen ending by this session are trimmed once the delay passes
+        with self.ended_tasks_lock:
+            ended = [t for t in ended if t['id'] not in self.ended_tasks]
+
+        self.trim_task_subscriber(ended)
+        self.trim_ended_tasks()
+
+    def save_entity_cache(self):
+        if not self.entity_cache:
+            return
+
+        for i in list(self.entity_subscribers.values()):
+            if isinstance(i, CachedEntitySubscriber):
+                i.save()
+
     def wait_entity_subscribers(self):
-        for i in self.entity_subscribers.values():
-            i.wait_ready()
+        for name, e in list(self.entity_subscribers.items()):
+            with profile_phase('sync {0}'.format(name)):
+                e.wait_ready()
+
+            info = self.entity_subscribers.materialized.get(name)
+            if info and info['sync_time'] is None:
+                info['sync_time'] = time.time() - info['started_at']
 
     def connect(self, password=None):
         try:
@@ -503,6 +748,11 @@ class Context(object):
             sys.exit(1)
 
     def login(self, user, password):
+        with profile_phase('login'):
+            self.__login(user, password)
+
+    def __login(self, user, password):
+        self.user = user
         try:
             self.connection.login_user(user, password)
             self.connection.subscribe_events(*EVENT_MASKS)
@@ -558,9 +808,37 @@ class Context(object):
             if hasattr(i, '_login'):
                 i._login(self)
 
+    def load_plugin(self, path):
+        if path in self.plugins:
+            return
+
+        self.lazy_plugins.pop(path, None)
+        self.__try_load_plugin(path)
+        plugin = self.plugins.get(path)
+        if plugin and self.session_id is not None and hasattr(plugin, '_login'):
+            plugin._login(self)
+
+    def load_plugins_for_task(self, name):
+        for path, wildcards in list(self.lazy_plugins.items()):
+            if any(fnmatch.fnmatch(name, i) for i in wildcards):
+                self.load_plugin(path)
+
     def __discover_plugin_dir(self, dir):
+        manifest = load_manifest(dir) if not self.docgen_run else {}
         for i in glob.glob1(dir, "*.py"):
-            self.__try_load_plugin(os.path.join(dir, i))
+            path = os.path.join(dir, i)
+            entry = manifest.get(i)
+            if entry and not entry['eager'] and entry['sha1'] == file_digest(path):
+                self.__register_lazy_plugin(path, entry)
+                continue
+
+            self.__try_load_plugin(path)
+
+    def __register_lazy_plugin(self, path, entry):
+        self.logger.debug(_("Deferring load of plugin %s"), path)
+        self.lazy_plugins[path] = entry['tasks']
+        for i in entry['namespaces']:
+            self.attach_namespace(i['path'], LazyNamespace(i['name'], self, path, i['description']))
 
     def __try_load_plugin(self, path):
         if path in self.plugins:
@@ -569,10 +847,11 @@ class Context(object):
         self.logger.debug(_("Loading plugin from %s"), path)
         name, ext = os.path.splitext(os.path.basename(path))
         try:
-            plugin = load_module_from_file(name, path)
-            if hasattr(plugin, '_init'):
-                plugin._init(self)
-                self.plugins[path] = plugin
+            with profile_phase('load plugin {0}'.format(name)):
+                plugin = load_module_from_file(name, path)
+                if hasattr(plugin, '_init'):
+                    plugin._init(self)
+                    self.plugins[path] = plugin
         except Exception:
             if self.variables.get('rollbar_enabled'):
                 rollbar.report_exc_info()
@@ -646,6 +925,9 @@ class Context(object):
     def map_tasks(self, task_wildcard, cls):
         self.reverse_task_mappings[task_wildcard] = cls
 
+    def register_formatter(self, name, formatter):
+        register_formatter(name, formatter)
+
     def connection_error(self, event, **kwargs):
         if event == ClientError.LOGOUT:
             self.output_queue.put('Logged out from server.')
@@ -667,12 +949,14 @@ class Context(object):
             task['progress'] = progress
             self.entity_subscribers['task'].update(task)
 
-            if task['id'] in self.pending_tasks:
-                self.pending_tasks[data['id']]['progress'] = progress
+            pending = self.pending_tasks.get(data['id'])
+            if pending:
+                pending['progress'] = progress
 
         self.print_event(event, data)
 
     def get_validation_errors(self, task):
+        self.load_plugins_for_task(task['name'])
         __, nsclass = best_match(
             self.reverse_task_mappings.items(),
             task['name'],
@@ -732,12 +1016,12 @@ class Context(object):
                 return
 
             for prop, __, msg in errors:
-                self.output_queue.put(_("Task #{0} validation error: {1}{2}{3}".format(
+                self.notifications.put(_("Task #{0} validation error: {1}{2}{3}".format(
                     task['id'],
                     prop,
                     ': ' if prop else '',
                     msg
-                )))
+                )), kind='validation errors')
 
     def output_thread(self):
         while True:
@@ -756,7 +1040,7 @@ class Context(object):
 
         translation = events.translate(self, event, data)
         if translation:
-            self.output_queue.put(translation)
+            self.notifications.put(translation, kind='events')
 
     def call_sync(self, name, *args, **kwargs):
         return self.connection.call_sync(name, *args, **kwargs) if not self.docgen_run else {}
@@ -781,16 +1065,14 @@ class Context(object):
         return tid
 
     def wait_for_task_with_progress(self, tid):
-        def update(progress, task):
-            message = task['progress']['message'] if 'progress' in task else task['state']
-            percentage = task['progress']['percentage'] if 'progress' in task else None
-            progress.update(percentage=percentage, message=message)
-
-        generator = None
-        progress = None
+        group = None
+        view = None
 
         try:
-            task = self.entity_subscribers['task'].get(tid, timeout=5)
+            task = self.task_history.get(tid) if self.task_history is not None else None
+            if not task:
+                task = self.entity_subscribers['task'].get(tid, timeout=5)
+
             if not task:
                 return _("Task {0} not found".format(tid))
 
@@ -802,34 +1084,19 @@ class Context(object):
             output_msg(_("Hit Ctrl+C to terminate task if needed"))
             output_msg(_("To background running task press 'Ctrl+Z'"))
 
-            progress = ProgressBar()
-            update(progress, task)
-            generator = self.entity_subscribers['task'].listen(tid)
-
-            for op, old, new in generator:
-                update(progress, new)
-
-                if new['state'] == 'FINISHED':
-                    progress.finish()
-                    break
-
-                if new['state'] == 'FAILED':
-                    six.print_()
-                    break
-
-                if new['state'] == 'ABORTED':
-                    six.print_()
-                    break
+            # Task and its subtasks are redrawn only when one of them changes
+            group = TaskGroup(None, self.entity_subscribers['task'])
+            group.add(tid)
+            group.scan()
+            view = TaskProgressView()
+            for __ in group.listen():
+                view.draw(group.tree())
         except KeyboardInterrupt:
-            if progress:
-                progress.end()
             six.print_()
             output_msg(_("User requested task termination. Abort signal sent"))
             self.call_sync('task.abort', tid)
         except SIGTSTPException:
                 # The User backgrounded the task by sending SIGTSTP (Ctrl+Z)
-                if progress:
-                    progress.end()
                 six.print_()
                 output_msg(_("Task {0} will continue to run in the background.".format(tid)))
                 output_msg(_("To bring it back to the foreground execute 'wait {0}'".format(tid)))
@@ -838,15 +1105,65 @@ class Context(object):
             # Now that we are done with the task unset the Ctrl+Z handler
             # lets set the SIGTSTP (Ctrl+Z) handler
             SIGTSTP_setter(set_flag=False)
-            if progress:
-                progress.end()
-            if generator:
-                del generator
+            if view:
+                view.end()
+            if group is not None:
+                group.close()
+
+    def wait_for_task_group(self, group):
+        view = None
+
+        try:
+            SIGTSTP_setter(set_flag=True)
+            output_msg(_("Hit Ctrl+C to terminate tasks if needed"))
+            output_msg(_("To background running tasks press 'Ctrl+Z'"))
+
+            group.scan()
+            view = TaskProgressView()
+            for __ in group.listen():
+                view.draw(group.tree(final=False), status=group.message, percentage=group.percentage)
+        except KeyboardInterrupt:
+            unfinished = group.unfinished()
+            six.print_()
+            output_msg(_("User requested tasks termination. Abort signal sent to {0} tasks".format(len(unfinished))))
+            for tid in unfinished:
+                self.call_sync('task.abort', tid)
+        except SIGTSTPException:
+            six.print_()
+            output_msg(_("Tasks of group {0} will continue to run in the background.".format(group.name)))
+            output_msg(_("To bring them back to the foreground execute 'wait group {0}'".format(group.name)))
+        finally:
+            SIGTSTP_setter(set_flag=False)
+            if view:
+                view.end()
 
     def submit_task(self, name, *args, **kwargs):
         callback = kwargs.pop('callback', None)
+        group = self.task_group
+        if group is not None:
+            # Tasks submitted within a group are not waited for one by
+            # one, but no more than group's cap of them runs at once
+            group.throttle()
+
         tid = self.submit_task_common_routine(name, callback, *args)
 
+        if group is not None:
+            group.add(tid)
+            return tid
+
+        if self.variables.get('tasks_blocking') and threading.current_thread() is not threading.main_thread():
+            # Progress bar and Ctrl+Z handling belong to the main thread,
+            # so workers of parallel loops just wait for their tasks
+            task = self.entity_subscribers['task'].wait_for(tid, lambda t: t['state'] in ('FINISHED', 'FAILED', 'ABORTED'))
+            if task['state'] != 'FINISHED':
+                raise CommandException(_("Task {0} {1}: {2}".format(
+                    tid,
+                    task['state'].lower(),
+                    get(task, 'error.message') or ''
+                )))
+
+            return tid
+
         if self.variables.get('tasks_blocking'):
             error_msgs = self.wait_for_task_with_progress(tid)
             if error_msgs:
@@ -892,6 +1209,7 @@ class Function(object):
         self.param_names = param_names
         self.exp = exp
         self.env = env
+        self.code = None
 
     @property
     def value(self):
@@ -900,7 +1218,13 @@ class Function(object):
     def __call__(self, env, *args):
         env = Environment(self.context, self.env, zip(self.param_names, args))
         try:
-            self.context.eval_block(self.exp, env, False)
+            if self.context.variables.get('compiler'):
+                if self.code is None:
+                    self.code = self.context.ml.compiler.compile_block(self.exp)
+
+                self.code(env)
+            else:
+                self.context.eval_block(self.exp, env, False)
         except FlowControlInstruction as f:
             if f.type == FlowControlInstructionType.RETURN:
                 return f.payload
@@ -964,6 +1288,331 @@ class Environment(dict):
         raise KeyError(var)
 
 
+class Compiler(object):
+    """
+    Translates AST nodes into Python closures taking an Environment.
+    Nodes which depend on the current path or the pipe state (command
+    calls, pipes, redirections) are left to MainLoop.eval, so compiled
+    code behaves exactly as the tree-walking evaluator does.
+    """
+    def __init__(self, ml):
+        self.ml = ml
+        self.context = ml.context
+
+    def get(self, token, first=False):
+        cache = token.__dict__.setdefault('compiled', {})
+        code = cache.get(first)
+        if code is None:
+            code = cache[first] = self.compile(token, first)
+
+        return code
+
+    def compile_block(self, block):
+        variables = self.context.variables
+        code = [self.compile(i, True) for i in block]
+
+        def run_block(env):
+            for stmt in code:
+                try:
+                    stmt(env)
+                except SystemExit:
+                    raise
+                except FlowControlInstruction:
+                    raise
+                except BaseException as e:
+                    if variables.get('abort_on_errors'):
+                        raise e
+
+                    continue
+
+        return run_block
+
+    def compile(self, token, first=False):
+        if not token:
+            return lambda env: []
+
+        if type(token) not in COMPILED_NODES:
+            return self.fallback(token, first)
+
+        code = getattr(self, 'compile_{0}'.format(type(token).__name__))(token, first)
+        if first:
+            reset = self.ml.reset_on_first_run
+
+            def run_first(env):
+                reset()
+                return code(env)
+
+            return run_first
+
+        return code
+
+    def fallback(self, token, first):
+        ml = self.ml
+        return lambda env: ml.eval(token, env=env, first=first)
+
+    def compile_Parentheses(self, token, first):
+        return self.compile(token.expr)
+
+    def compile_UnaryExpr(self, token, first):
+        expr = self.compile(token.expr)
+        if token.op == '-':
+            return lambda env: -expr(env)
+
+        operators = self.context.builtin_operators
+        op = token.op
+        return lambda env: operators[op](expr(env))
+
+    def compile_BinaryExpr(self, token, first):
+        left = self.compile(token.left)
+        right = self.compile(token.right)
+        operators = self.context.builtin_operators
+        op = token.op
+
+        def run(env):
+            lvalue = left(env)
+            rvalue = right(env)
+            return operators[op](lvalue, rvalue)
+
+        return run
+
+    def compile_Literal(self, token, first):
+        if token.type in six.string_types:
+            value = token.value.replace('\\\"', '"')
+            return lambda env: value
+
+        if token.type is list:
+            items = [self.compile(i) for i in token.value]
+            return lambda env: [i(env) for i in items]
+
+        if token.type is dict:
+            items = [(self.compile(k), self.compile(v)) for k, v in token.value.items()]
+            return lambda env: {k(env): v(env) for k, v in items}
+
+        value = token.value
+        return lambda env: value
+
+    def compile_AnonymousFunction(self, token, first):
+        context = self.context
+        return lambda env: Function(context, '<anonymous>', token.args, token.body, env)
+
+    def compile_Symbol(self, token, first):
+        ml = self.ml
+        variables = self.context.variables
+        name = token.name
+        return lambda env: ml.eval_symbol(name, ml.cwd, env, variables)
+
+    def compile_AssignmentStatement(self, token, first):
+        expr = self.compile(token.expr, first)
+        variables = self.context.variables.variables
+        name = token.name
+        if isinstance(name, Subscript):
+            array = self.compile(name.expr)
+            index = self.compile(name.index)
+
+        def run(env):
+            value = flatten_table(expr(env))
+            if name in variables:
+                raise SyntaxError(_(
+                    "{0} is a configuration variable. Use `setopt` command to set it".format(name)
+                ))
+
+            if isinstance(name, Subscript):
+                array(env)[index(env)] = value
+                return
+
+            try:
+                var = env.find(name)
+                if var.const:
+                    raise SyntaxError('{0} is defined as a constant'.format(name))
+
+                var.value = value
+            except KeyError:
+                env[name] = Environment.Variable(value)
+
+        return run
+
+    def compile_ConstStatement(self, token, first):
+        expr = self.compile(token.expr, first)
+        name = token.name.name
+
+        def run(env):
+            env[name] = Environment.Variable(expr(env), True)
+
+        return run
+
+    def compile_IfStatement(self, token, first):
+        expr = self.compile(token.expr)
+        body = self.compile_block(token.body)
+        else_body = self.compile_block(token.else_body)
+
+        def run(env):
+            if expr(env):
+                body(env)
+            else:
+                else_body(env)
+
+        return run
+
+    def compile_ForStatement(self, token, first):
+        stmt1 = self.compile(token.stmt1)
+        expr = self.compile(token.expr)
+        stmt2 = self.compile(token.stmt2)
+        body = self.compile_block(token.body)
+
+        def run(env):
+            stmt1(env)
+            while expr(env):
+                body(env)
+                stmt2(env)
+
+        return run
+
+    def compile_ForInStatement(self, token, first):
+        context = self.context
+        expr = self.compile(token.expr)
+        body = self.compile_block(token.body)
+        var = token.var
+
+        def run(env):
+            local_env = Environment(context, outer=env)
+            value = expr(env)
+            if isinstance(var, tuple):
+                if isinstance(value, dict):
+                    value = value.items()
+                else:
+                    value = value.copy()
+
+                for k, v in value:
+                    local_env[var[0]] = k
+                    local_env[var[1]] = v
+                    try:
+                        body(local_env)
+                    except FlowControlInstruction as f:
+                        if f.type == FlowControlInstructionType.BREAK:
+                            return
+
+                        raise f
+            else:
+                for i in value:
+                    local_env[var] = i
+                    try:
+                        body(local_env)
+                    except FlowControlInstruction as f:
+                        if f.type == FlowControlInstructionType.BREAK:
+                            return
+
+                        raise f
+
+        return run
+
+    def compile_WhileStatement(self, token, first):
+        expr = self.compile(token.expr)
+        body = self.compile_block(token.body)
+
+        def run(env):
+            while expr(env):
+                try:
+                    body(env)
+                except FlowControlInstruction as f:
+                    if f.type == FlowControlInstructionType.BREAK:
+                        return
+
+                    raise f
+
+        return run
+
+    def compile_ReturnStatement(self, token, first):
+        expr = self.compile(token.expr)
+
+        def run(env):
+            raise FlowControlInstruction(FlowControlInstructionType.RETURN, expr(env))
+
+        return run
+
+    def compile_BreakStatement(self, token, first):
+        def run(env):
+            raise FlowControlInstruction(FlowControlInstructionType.BREAK)
+
+        return run
+
+    def compile_UndefStatement(self, token, first):
+        name = token.name
+
+        def run(env):
+            del env[name]
+
+        return run
+
+    def compile_AssertStatement(self, token, first):
+        expr = self.compile(token.expr, first)
+        msg = self.compile(token.msg)
+
+        def run(env):
+            if not expr(env):
+                raise CommandException('Assertion failed: {0}'.format(msg(env)))
+
+        return run
+
+    def compile_ExpressionExpansion(self, token, first):
+        expr = self.compile(token.expr, first)
+
+        def run(env):
+            return flatten_table(expr(env))
+
+        return run
+
+    compile_CommandExpansion = compile_ExpressionExpansion
+
+    def compile_FunctionCall(self, token, first):
+        context = self.context
+        args = [self.compile(i, True) for i in token.args]
+        name = token.name
+
+        def run(env):
+            values = [flatten_table(i(env)) for i in args]
+            func = env.find(name)
+            if func:
+                if isinstance(func, Environment.Variable):
+                    func = func.value
+
+                with context.call_frame(CallStackEntry(func.name, values, token.file, token.line, token.column)):
+                    return func(env, *values)
+
+            raise SyntaxError("Function {0} not found".format(name))
+
+        return run
+
+    def compile_Subscript(self, token, first):
+        expr = self.compile(token.expr)
+        index = self.compile(token.index)
+
+        def run(env):
+            value = flatten_table(expr(env))
+            return value[index(env)]
+
+        return run
+
+    def compile_FunctionDefinition(self, token, first):
+        context = self.context
+        name = token.name
+
+        def run(env):
+            env[name] = Function(context, name, token.args, token.body, env)
+
+        return run
+
+    def compile_Quote(self, token, first):
+        return lambda env: token
+
+
+COMPILED_NODES = (
+    Parentheses, UnaryExpr, BinaryExpr, Literal, AnonymousFunction, Symbol, AssignmentStatement,
+    ConstStatement, IfStatement, ForStatement, ForInStatement, WhileStatement, ReturnStatement,
+    BreakStatement, UndefStatement, AssertStatement, ExpressionExpansion, CommandExpansion,
+    FunctionCall, Subscript, FunctionDefinition, Quote
+)
+
+
 class MainLoop(object):
     pipe_commands = {
         'search': SearchPipeCommand,
@@ -973,6 +1622,10 @@ class MainLoop(object):
         'head': LimitPipeCommand,
         'tail': TailPipeCommand,
         'select': SelectPipeCommand,
+        'count': CountPipeCommand,
+        'sum': SumPipeCommand,
+        'group_by': GroupByPipeCommand,
+        'uniq': UniqPipeCommand,
         'find': FindPipeCommand,
         'more': MorePipeCommand,
         'less': MorePipeCommand,
@@ -1001,14 +1654,19 @@ class MainLoop(object):
         'whoami': WhoamiCommand,
         'pending': PendingCommand,
         'wait': WaitCommand,
+        'task_group': TaskGroupCommand,
+        'notifications': NotificationsCommand,
         'alias': AliasCommand,
         'unalias': UnaliasCommand,
         'vars': ListVarsCommand,
         'attach_debugger': AttachDebuggerCommand,
         'w': WCommand,
         'time': TimeCommand,
+        'profile': ProfileCommand,
         'remote': RemoteCommand,
-        'builtin': BuiltinCommand
+        'builtin': BuiltinCommand,
+        'subscribers': SubscribersCommand,
+        'cache': CacheCommand
     }
     builtin_commands = base_builtin_commands.copy()
     builtin_commands.update(pipe_commands)
@@ -1023,14 +1681,16 @@ class MainLoop(object):
         self.aliases = {}
         self.connection = None
         self.saved_state = None
+        self.compiler = Compiler(self)
 
     def __get_prompt(self):
+        jobs = self.context.pending_jobs
         variables = collections.defaultdict(lambda: '', {
             'path': '/'.join([str(x.get_name()) for x in self.path]),
             'host': self.context.uri,
             'user': self.context.user,
-            'jobs': self.context.pending_jobs,
-            'jobs_short': '[{0}] '.format(self.context.pending_jobs) if self.context.pending_jobs else '',
+            'jobs': jobs,
+            'jobs_short': '[{0}] '.format(jobs) if jobs else '',
             '#0': '\001\033[0m\002',
             '#bold': '\001\033[1m\002',
             '#dim': '\001\033[2m\002',
@@ -1134,7 +1794,12 @@ class MainLoop(object):
             if ns:
                 return ns
 
-        cwd_namespaces = cwd.namespaces()
+        if isinstance(cwd, EntitySubscriberBasedLoadMixin):
+            # Entities were already looked up in the name index above
+            cwd_namespaces = cwd.static_namespaces()
+        else:
+            cwd_namespaces = cwd.namespaces()
+
         cwd_commands = list(cwd.commands().items())
 
         if isinstance(token, six.string_types) and token.startswith('@'):
@@ -1184,6 +1849,93 @@ class MainLoop(object):
 
                 continue
 
+    def eval_parallel_for(self, token, env):
+        options = {k: self.eval(v, env=env) for k, v in token.options}
+        unknown = set(options) - {'workers', 'ordered', 'errors'}
+        if unknown:
+            raise SyntaxError(_("Unknown parallel for option(s): {0}".format(', '.join(sorted(unknown)))))
+
+        workers = int(options.get('workers', self.context.variables.get('parallel_workers')))
+        ordered = options.get('ordered', True)
+        errors = options.get('errors', 'first')
+        if workers < 1:
+            raise SyntaxError(_("Number of workers must be positive"))
+
+        if errors not in ('first', 'collect'):
+            raise SyntaxError(_("errors option can be either \"first\" or \"collect\""))
+
+        expr = self.eval(token.expr, env=env)
+        if isinstance(token.var, tuple):
+            expr = expr.items() if isinstance(expr, dict) else expr.copy()
+
+        if self.context.variables.get('compiler'):
+            code = [self.compiler.get(i, True) for i in token.body]
+        else:
+            code = [lambda e, stmt=i: self.eval(stmt, env=e, first=True) for i in token.body]
+
+        stop = threading.Event()
+        control = []
+        call_stack = list(self.context.call_stack)
+
+        def iteration(item):
+            # Worker threads report calls made by the body on top of the
+            # frames of the loop itself
+            self.context.call_stack = list(call_stack)
+            # Every iteration gets its own environment, so loop variables
+            # and locals of concurrently running bodies do not clash
+            local_env = Environment(self.context, outer=env)
+            if isinstance(token.var, tuple):
+                local_env[token.var[0]], local_env[token.var[1]] = item
+            else:
+                local_env[token.var] = item
+
+            result = None
+            try:
+                for stmt in code:
+                    result = stmt(local_env)
+            except FlowControlInstruction as f:
+                control.append(f)
+                stop.set()
+                return
+
+            return result
+
+        results = []
+        failures = []
+        for idx, item, result, error in run_parallel(iteration, expr, workers, stop):
+            if error:
+                if isinstance(error, SystemExit):
+                    raise error
+
+                failures.append((idx, item, error))
+                if errors == 'first':
+                    stop.set()
+
+                continue
+
+            if result is not None:
+                results.append((idx, result))
+
+        returns = [f for f in control if f.type == FlowControlInstructionType.RETURN]
+        if returns:
+            raise returns[0]
+
+        if failures:
+            failures.sort(key=lambda f: f[0])
+            if errors == 'first':
+                raise failures[0][2]
+
+            raise CommandException(_("{0} iterations failed:\n{1}".format(
+                len(failures),
+                '\n'.join('  {0}: {1}'.format(format_value(item), error) for __, item, error in failures)
+            )))
+
+        if ordered:
+            results.sort(key=lambda r: r[0])
+
+        if results:
+            return Sequence(*(r for __, r in results))
+
     def get_cwd(self, path):
         if not path:
             return self.cwd
@@ -1199,6 +1951,34 @@ class MainLoop(object):
 
     def reset_on_first_run(self):
         self.context.pipe_cwd = None
+        self.context.pipe_filtered = False
+
+    def eval_symbol(self, name, cwd, env, variables):
+        item = self.find_in_scope(name, cwd=cwd, env=env, variables=variables)
+        if item is not None:
+            return item
+
+        item = self.find_in_scope(name.split('/')[0], cwd=cwd, env=env, variables=variables) \
+            if isinstance(name, str) \
+            else None
+
+        if item is not None:
+            raise SyntaxError("Use of slashes as separators not allowed. Please use spaces instead or "
+                              "use the 'cd' command to navigate")
+
+        try:
+            item = env.find(name)
+            return item.value if isinstance(item, Environment.Variable) else item
+        except KeyError:
+
+            # After all scope checks are done check if this is a
+            # config environment var of the cli
+            try:
+                return self.context.variables.variables[name].value
+            except KeyError:
+                pass
+
+            raise SyntaxError(_('{0} not found'.format(name)))
 
     def eval(self, token, **kwargs):
         path = kwargs.pop('path', [])
@@ -1206,6 +1986,7 @@ class MainLoop(object):
         input_data = kwargs.pop('input_data', None)
         dry_run = kwargs.pop('dry_run', None)
         first = kwargs.pop('first', False)
+        cursor = kwargs.pop('cursor', 0)
         env = kwargs.pop('env', self.context.global_env)
         variables = kwargs.pop('variables', self.context.variables)
         cwd = self.get_cwd(path)
@@ -1255,31 +2036,7 @@ class MainLoop(object):
                 return Function(self.context, '<anonymous>', token.args, token.body, env)
 
             if isinstance(token, Symbol):
-                item = self.find_in_scope(token.name, cwd=cwd, env=env, variables=variables)
-                if item is not None:
-                    return item
-
-                item = self.find_in_scope(token.name.split('/')[0], cwd=cwd, env=env, variables=variables) \
-                    if isinstance(token.name, str) \
-                    else None
-
-                if item is not None:
-                    raise SyntaxError("Use of slashes as separators not allowed. Please use spaces instead or "
-                                        "use the 'cd' command to navigate")
-
-                try:
-                    item = env.find(token.name)
-                    return item.value if isinstance(item, Environment.Variable) else item
-                except KeyError:
-
-                    # After all scope checks are done check if this is a
-                    # config environment var of the cli
-                    try:
-                        return self.context.variables.variables[token.name].value
-                    except KeyError:
-                        pass
-
-                    raise SyntaxError(_('{0} not found'.format(token.name)))
+                return self.eval_symbol(token.name, cwd, env, variables)
 
             if isinstance(token, AssignmentStatement):
                 expr = flatten_table(self.eval(token.expr, env=env, first=first))
@@ -1317,6 +2074,10 @@ class MainLoop(object):
                 self.eval_block(body, env, False)
                 return
 
+            if isinstance(token, (ForStatement, ForInStatement, WhileStatement)) and \
+                    self.context.variables.get('compiler'):
+                return self.compiler.get(token, first)(env)
+
             if isinstance(token, ForStatement):
                 self.eval(token.stmt1, env=env)
 
@@ -1357,6 +2118,9 @@ class MainLoop(object):
 
                 return
 
+            if isinstance(token, ParallelForStatement):
+                return self.eval_parallel_for(token, env)
+
             if isinstance(token, WhileStatement):
                 while True:
                     expr = self.eval(token.expr, env=env)
@@ -1416,12 +2180,13 @@ class MainLoop(object):
                 return expr
 
             if isinstance(token, CommandCall):
-                token = copy.deepcopy(token)
+                # AST is shared between invocations, so instead of consuming
+                # token.args we advance a cursor over it
                 success = True
                 error = None
 
                 try:
-                    if len(token.args) == 0:
+                    if cursor >= len(token.args):
                         if path[0] == self.context.root_ns:
                             self.path = self.root_path[:]
                             path.pop(0)
@@ -1434,9 +2199,11 @@ class MainLoop(object):
 
                         return
 
-                    top = token.args.pop(0)
+                    top = token.args[cursor]
+                    cursor += 1
                     if top == '..':
-                        if len(token.args) > 0 and isinstance(token.args[0], Symbol) and '/' in token.args[0].name:
+                        if cursor < len(token.args) and isinstance(token.args[cursor], Symbol) and \
+                                '/' in token.args[cursor].name:
                             raise SyntaxError("Use of slashes as separators not allowed. Please use spaces instead or "
                                               "use the 'cd' command to navigate")
                         if len(path) == 0:
@@ -1449,11 +2216,11 @@ class MainLoop(object):
                                 self.path[-2].on_enter()
 
                         path.append('..')
-                        return self.eval(token, env=env, path=path, dry_run=dry_run)
+                        return self.eval(token, env=env, path=path, dry_run=dry_run, cursor=cursor)
                     elif isinstance(top, Symbol) and top.name == '/':
                         if first:
                             self.start_from_root = True
-                            return self.eval(token, env=env, path=path, dry_run=dry_run)
+                            return self.eval(token, env=env, path=path, dry_run=dry_run, cursor=cursor)
 
                     if isinstance(top, ExpressionExpansion):
                         top = Symbol(self.eval(top, env=env, path=path))
@@ -1465,14 +2232,14 @@ class MainLoop(object):
 
                     if isinstance(item, Namespace):
                         item.on_enter()
-                        return self.eval(token, env=env, path=path+[item], dry_run=dry_run)
+                        return self.eval(token, env=env, path=path+[item], dry_run=dry_run, cursor=cursor)
 
                     if isinstance(item, Alias):
                         return self.eval(item.ast, env=env, path=path)[0]
 
                     if isinstance(item, Command):
                         completions = item.complete(self.context)
-                        token_args = convert_to_literals(token.args)
+                        token_args = convert_to_literals(token.args[cursor:])
                         if len(token_args) > 0 and token_args[0] == '..':
                             args = [token_args[0]]
                             kwargs = None
@@ -1494,14 +2261,21 @@ class MainLoop(object):
                         if isinstance(item, PipeCommand):
                             if first:
                                 raise CommandException(_('Invalid usage.\n{0}'.format(inspect.getdoc(item))))
-                            if serialize_filter:
+                            # Stages after rows were aggregated or counted work on
+                            # that stage's output and run locally, not in the query
+                            if serialize_filter and not set(serialize_filter['params']) & {'aggregate', 'count'}:
                                 ret = item.serialize_filter(self.context, args, kwargs, opargs)
                                 if ret is not None:
                                     if 'filter' in ret:
                                         serialize_filter['filter'] += ret['filter']
 
                                     if 'params' in ret:
-                                        serialize_filter['params'].update(ret['params'])
+                                        params = dict(ret['params'])
+                                        # Fields of a second select are columns of the first one
+                                        if 'select' in params and 'select' in serialize_filter['params']:
+                                            del params['select']
+
+                                        serialize_filter['params'].update(params)
 
                             return item.run(self.context, args, kwargs, opargs, input=input_data)
                         else:
@@ -1525,13 +2299,8 @@ class MainLoop(object):
                     if isinstance(func, Environment.Variable):
                         func = func.value
 
-                    self.context.call_stack.append(
-                        CallStackEntry(func.name, args, token.file, token.line, token.column)
-                    )
-
-                    result = func(env, *args)
-                    self.context.call_stack.pop()
-                    return result
+                    with self.context.call_frame(CallStackEntry(func.name, args, token.file, token.line, token.column)):
+                        return func(env, *args)
 
                 raise SyntaxError("Function {0} not found".format(token.name))
 
@@ -1558,6 +2327,9 @@ class MainLoop(object):
                 if self.context.pipe_cwd is None:
                     cwd.on_enter()
                     self.context.pipe_cwd = cwd
+                    # Filters of the whole pipe are pushed down to the first
+                    # command if it can take them, and evaluated locally if not
+                    self.context.pipe_filtered = isinstance(cmd, FilteringCommand)
 
                 if isinstance(cmd, FilteringCommand):
                     # Do serialize_filter pass
@@ -1613,47 +2385,80 @@ class MainLoop(object):
             return
 
         try:
-            try:
+            with profile_phase('parse'):
                 tokens = parse(line, '<stdin>')
-            except KeyboardInterrupt:
-                return
-            except SyntaxError:
-                add_line_to_history(line)
-                raise
+        except KeyboardInterrupt:
+            return
+        except SyntaxError as e:
+            add_line_to_history(line)
+            output_msg(_('Syntax error: {0}'.format(str(e))))
+            return 1
 
-            if not tokens:
-                return
+        if not tokens:
+            return
 
-            # Unparse AST to string and add to readline history and history file
-            line = '; '.join(unparse(t, oneliner=True) for t in tokens)
-            add_line_to_history(line)
+        # Unparse AST to string and add to readline history and history file
+        line = '; '.join(unparse(t, oneliner=True) for t in tokens)
+        add_line_to_history(line)
+        return self.execute(tokens)
 
+    def process_script(self, path):
+        """
+        Runs whole script file as a single block. Compiled scripts are
+        cached, so only the first run of a script pays the parsing cost.
+        """
+        try:
+            with profile_phase('parse'):
+                if path == '-':
+                    tokens = parse(sys.stdin.read(), '<stdin>')
+                else:
+                    tokens = load_script(path)
+        except SyntaxError as e:
+            output_msg(_('Syntax error: {0}'.format(str(e))))
+            return 1
+        except UnicodeDecodeError as e:
+            output_msg(_('Incorrect filetype, cannot parse file: {0}'.format(str(e))))
+            return 1
+
+        if not tokens:
+            return 0
+
+        return self.execute(tokens, abort_on_errors=self.context.variables.get('abort_on_errors'))
+
+    def execute(self, tokens, abort_on_errors=True):
+        try:
             for i in tokens:
                 try:
                     self.context.call_stack = []
-                    ret = self.eval(i, first=True, printable_none=True)
+                    with profile_phase('eval'):
+                        ret = self.eval(i, first=True, printable_none=True)
                 except SystemExit as err:
                     raise err
                 except BaseException as err:
                     output_msg('Error: {0}'.format(str(err)))
-                    if len(self.context.call_stack) > 1:
+                    call_stack = getattr(err, 'call_stack', None) or self.context.call_stack
+                    if len(call_stack) > 1:
                         output_msg('Call stack: ')
-                        for i in self.context.call_stack:
+                        for i in call_stack:
                             output_msg('  ' + str(i))
 
                     if self.context.variables.get('debug'):
                         output_msg('Python call stack: ')
                         output_msg(traceback.format_exc())
 
-                    return
+                    if abort_on_errors:
+                        return
+
+                    continue
 
                 if ret is not None:
-                    output = self.context.variables.get('output')
-                    if output:
-                        with open(output, 'a+') as f:
-                            format_output(ret, file=f)
-                    else:
-                        format_output(ret)
+                    with profile_phase('render'):
+                        output = self.context.variables.get('output')
+                        if output:
+                            with open(output, 'a+') as f:
+                                format_output(ret, file=f)
+                        else:
+                            format_output(ret)
         except SyntaxError as e:
             output_msg(_('Syntax error: {0}'.format(str(e))))
             return 1
@@ -1712,7 +2517,12 @@ class MainLoop(object):
                 continue
 
             if issubclass(type(ptr), Namespace):
-                for ns in ptr.namespaces():
+                nss = ptr.namespaces()
+                if isinstance(ptr, EntitySubscriberBasedLoadMixin):
+                    item = ptr.namespace_by_name(name)
+                    nss = [item] if item else ptr.static_namespaces()
+
+                for ns in nss:
                     if ns.get_name() == name:
                         path.append(ns)
                         ptr = path[-1]
@@ -1793,7 +2603,7 @@ class MainLoop(object):
                     c_opargs = []
 
                     with contextlib.suppress(BaseException):
-                        token_args = convert_to_literals(copy.deepcopy(token).args)
+                        token_args = convert_to_literals(token.args)
 
                         if len(token_args) > 0 and token_args[0] == '..':
                             args = [token_args[0]]
@@ -1892,6 +2702,7 @@ def main(argv=None):
     parser.add_argument('uri', metavar='URI', nargs='?',
                         default='unix:')
     parser.add_argument('--makedocs', action='store_true', help='Generate CLI documentation metadata and leave')
+    parser.add_argument('--makemanifest', action='store_true', help='Generate plugin namespace manifest and leave')
     parser.add_argument('-m', metavar='MIDDLEWARECONFIG',
                         default=DEFAULT_MIDDLEWARE_CONFIGFILE)
     parser.add_argument('-c', metavar='CONFIG', default=DEFAULT_CLI_CONFIGFILE)
@@ -1899,12 +2710,34 @@ def main(argv=None):
     parser.add_argument('-f', metavar='INPUT')
     parser.add_argument('-p', metavar='PASSWORD')
     parser.add_argument('-D', metavar='DEFINE', action='append')
+    parser.add_argument('--profile', action='store_true', help='Print timing breakdown of CLI phases on exit')
+    parser.add_argument('--profile-dump', metavar='FILE', help='Save cProfile statistics to FILE (implies --profile)')
     args = parser.parse_args(argv)
 
     context = Context()
     context.argparse_parser = parser
+    if args.profile or args.profile_dump:
+        profiler = Profiler(context, args.profile_dump)
+        profiler.start()
+
+        def print_profile():
+            try:
+                profiler.stop()
+            except OSError as err:
+                output_msg(_("Cannot save profile to {0}: {1}".format(profiler.dump, err.strerror)))
+
+            format_output(profiler.report())
+
+        atexit.register(print_profile)
     context.docgen_run = args.makedocs
 
+    if args.makemanifest:
+        context.read_middleware_config_file(args.m)
+        for dir in context.plugin_dirs:
+            generate_manifest(dir)
+            output_msg(_("Generated plugin manifest for {0}".format(dir)))
+        return
+
     if not context.docgen_run and os.environ.get('FREENAS_SYSTEM') != 'YES' and args.uri == 'unix:':
         args.uri = six.moves.input('Please provide FreeNAS IP: ')
 
@@ -1966,9 +2799,9 @@ def main(argv=None):
         docgen.write_docs()
         return
 
+    atexit.register(context.save_entity_cache)
     if username is not None:
         context.login(username, args.p)
-        context.user = username
     elif context.local_connection:
         context.user = getpass.getuser()
         context.login(context.user, '')
@@ -1985,16 +2818,12 @@ def main(argv=None):
     if args.f:
         context.wait_entity_subscribers()
         try:
-            f = sys.stdin if args.f == '-' else open(args.f)
-            for line in f:
-                ml.process(line.strip())
-
-            f.close()
+            ret = ml.process_script(args.f)
         except EnvironmentError as e:
             sys.stderr.write('Cannot open input file: {0}'.format(str(e)))
             sys.exit(1)
 
-        return
+        sys.exit(ret)
 
     try:
         with open(os.path.expanduser('~/.cli_history'), 'rb') as history_file:
@@ -2012,9 +2841,10 @@ def main(argv=None):
     for path in cli_rc_paths:
         if os.path.isfile(path):
             try:
-                with open(path, 'r') as f:
-                    ast = parse(f.read(), path)
-                    context.eval_block(ast)
+                with profile_phase('clirc'):
+                    with open(path, 'r') as f:
+                        ast = parse(f.read(), path)
+                        context.eval_block(ast)
             except UnicodeDecodeError as e:
                 raise CommandException(_(
                     "Incorrect filetype, cannot parse clirc file: {0}".format(str(e))
@@ -0,0 +1,109 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+
+import os
+import json
+import hashlib
+import logging
+from freenas.cli import config
+from freenas.cli import parser
+from freenas.cli.manifest import file_digest
+
+
+AST_CACHE_VERSION = 1
+AST_CACHE_DIR = os.path.join(config.CONFIG_DIR, 'ast')
+logger = logging.getLogger('cli.script')
+_cli_version = None
+
+
+def cli_version():
+    """
+    Identifies the grammar and AST layout of the running CLI. Cached
+    scripts compiled by a different parser are discarded.
+    """
+    global _cli_version
+    if _cli_version is None:
+        try:
+            _cli_version = file_digest(parser.__file__)
+        except (IOError, OSError, TypeError):
+            _cli_version = ''
+
+    return _cli_version
+
+
+def _cache_filename(path):
+    return os.path.join(AST_CACHE_DIR, '{0}.json'.format(hashlib.sha1(path.encode('utf-8')).hexdigest()))
+
+
+def _cache_key(path, st):
+    return [AST_CACHE_VERSION, cli_version(), path, st.st_mtime, st.st_size]
+
+
+def _read_cached(path, key):
+    try:
+        with open(_cache_filename(path), 'r') as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if cached.get('key') != key:
+        return None
+
+    return parser.read_ast(cached['ast'])
+
+
+def _write_cached(path, key, ast):
+    filename = _cache_filename(path)
+    try:
+        os.makedirs(AST_CACHE_DIR, mode=0o700, exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump({'key': key, 'ast': parser.dump_ast(ast)}, f)
+
+        os.rename(filename + '.tmp', filename)
+    except (IOError, OSError, TypeError, ValueError) as err:
+        logger.debug('Cannot cache compiled script %s: %s', path, err)
+
+
+def load_script(path):
+    """
+    Parses whole script file and returns its AST. Compiled scripts are
+    cached on disk keyed by path, modification time and CLI version, so
+    unchanged scripts are not parsed again.
+    """
+    path = os.path.realpath(os.path.expanduser(path))
+    st = os.stat(path)
+    key = _cache_key(path, st)
+    ast = _read_cached(path, key)
+    if ast is not None:
+        return ast
+
+    with open(path, 'rb') as f:
+        ast = parser.parse(f.read().decode('utf8'), path) or []
+
+    _write_cached(path, key, ast)
+    return ast
@@ -0,0 +1,277 @@
+#
+# Copyright 2016 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import threading
+import collections
+from freenas.utils.query import get
+
+
+FINAL_STATES = ('FINISHED', 'FAILED', 'ABORTED')
+
+
+class TaskGroup(object):
+    """
+    Named set of tasks submitted without waiting for each of them.
+    Task states are followed through the task entity subscriber, so
+    waiting for the whole group costs no extra calls. Subtasks of the
+    group tasks are followed too, for display only.
+    """
+    def __init__(self, name, subscriber, max_running=0):
+        self.name = name
+        self.subscriber = subscriber
+        self.max_running = max_running
+        self.tasks = collections.OrderedDict()
+        self.subtasks = collections.OrderedDict()
+        self.version = 0
+        self.cv = threading.Condition()
+        self.on_update = lambda old, new: self.update(new)
+        subscriber.on_add.add(self.update)
+        subscriber.on_update.add(self.on_update)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def add(self, tid):
+        with self.cv:
+            self.tasks[tid] = self.subscriber.items.get(tid)
+            self.version += 1
+            self.cv.notify_all()
+
+    def scan(self):
+        """
+        Picks up subtasks which were created before their parents were
+        added to the group.
+        """
+        with self.cv:
+            found = True
+            while found:
+                found = False
+                for t in list(self.subscriber.items.values()):
+                    if t['id'] in self.subtasks or t['id'] in self.tasks:
+                        continue
+
+                    if t.get('parent') in self.tasks or t.get('parent') in self.subtasks:
+                        self.subtasks[t['id']] = t
+                        found = True
+
+            self.version += 1
+            self.cv.notify_all()
+
+    def update(self, task):
+        with self.cv:
+            tid, parent = task['id'], task.get('parent')
+            if tid in self.tasks:
+                self.tasks[tid] = task
+            elif tid in self.subtasks or parent in self.tasks or parent in self.subtasks:
+                self.subtasks[tid] = task
+            else:
+                return
+
+            self.version += 1
+            self.cv.notify_all()
+
+    def close(self):
+        self.subscriber.on_add.discard(self.update)
+        self.subscriber.on_update.discard(self.on_update)
+
+    def count(self, *states):
+        return sum(1 for t in self.tasks.values() if t and t['state'] in states)
+
+    @property
+    def running(self):
+        return len(self.tasks) - self.count(*FINAL_STATES)
+
+    @property
+    def done(self):
+        return self.running == 0
+
+    @property
+    def percentage(self):
+        if not self.tasks:
+            return 100
+
+        total = 0
+        for t in self.tasks.values():
+            if not t:
+                continue
+
+            if t['state'] in FINAL_STATES:
+                total += 100
+                continue
+
+            total += get(t, 'progress.percentage') or 0
+
+        return total / len(self.tasks)
+
+    @property
+    def message(self):
+        return '{0}/{1} tasks done, {2} failed, {3} aborted'.format(
+            self.count(*FINAL_STATES),
+            len(self.tasks),
+            self.count('FAILED'),
+            self.count('ABORTED')
+        )
+
+    def tree(self, final=True):
+        """
+        Returns a list of (depth, task) pairs listing every task of the
+        group followed by its subtasks. Tasks which already ended, along
+        with their subtasks, are left out unless ``final`` is set.
+        """
+        with self.cv:
+            children = collections.defaultdict(list)
+            for t in self.subtasks.values():
+                children[t.get('parent')].append(t)
+
+            result = []
+            stack = [(0, t) for t in reversed(list(self.tasks.values())) if t]
+            while stack:
+                depth, task = stack.pop()
+                if not final and task['state'] in FINAL_STATES:
+                    continue
+
+                result.append((depth, task))
+                stack.extend((depth + 1, t) for t in reversed(children.get(task['id'], [])))
+
+            return result
+
+    def failures(self):
+        return [t for t in self.tasks.values() if t and t['state'] in ('FAILED', 'ABORTED')]
+
+    def unfinished(self):
+        return [tid for tid, t in self.tasks.items() if not t or t['state'] not in FINAL_STATES]
+
+    def throttle(self):
+        """
+        Blocks until less than max_running tasks of the group are running.
+        """
+        if not self.max_running:
+            return
+
+        with self.cv:
+            while self.running >= self.max_running:
+                self.cv.wait(1)
+
+    def listen(self):
+        """
+        Yields the group once and then every time any of its tasks or
+        subtasks changes, until all tasks of the group end.
+        """
+        version = None
+        while True:
+            with self.cv:
+                while self.version == version and not self.done:
+                    # Timeout only keeps the wait interruptible by Ctrl+C
+                    self.cv.wait(1)
+
+                version = self.version
+                done = self.done
+
+            yield self
+            if done:
+                return
+
+    def wait(self, callback=None):
+        """
+        Blocks until all tasks of the group end, calling callback(group)
+        whenever any of them changes.
+        """
+        for __ in self.listen():
+            if callback:
+                callback(self)
+
+
+class PendingTasks(object):
+    """
+    Tasks which did not end yet, indexed by session. Per-session counts
+    of tasks in every state are kept up to date on each change, so the
+    prompt can show them without walking all tasks running on the system.
+    """
+    def __init__(self):
+        self.tasks = {}
+        self.sessions = collections.defaultdict(collections.OrderedDict)
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def __contains__(self, tid):
+        return tid in self.tasks
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def get(self, tid, default=None):
+        return self.tasks.get(tid, default)
+
+    def __count(self, task, delta):
+        root = task.get('parent') is None
+        self.counts[(task['session'], task['state'], root)] += delta
+        self.counts[(task['session'], None, root)] += delta
+
+    def __remove(self, tid):
+        task = self.tasks.pop(tid, None)
+        if task is None:
+            return
+
+        self.__count(task, -1)
+        session = self.sessions[task['session']]
+        session.pop(tid, None)
+        if not session:
+            del self.sessions[task['session']]
+
+    def update(self, task):
+        with self.lock:
+            self.__remove(task['id'])
+            if task['state'] in FINAL_STATES:
+                return
+
+            self.tasks[task['id']] = task
+            self.sessions[task['session']][task['id']] = task
+            self.__count(task, 1)
+
+    def session(self, session_id, roots=False):
+        """
+        Returns pending tasks of a session, optionally only these which
+        are not subtasks of other tasks.
+        """
+        with self.lock:
+            tasks = list(self.sessions.get(session_id, {}).values())
+
+        if roots:
+            return [t for t in tasks if t.get('parent') is None]
+
+        return tasks
+
+    def count(self, session_id, state=None, roots=True):
+        """
+        Number of pending tasks of a session, optionally in a given state.
+        Subtasks are counted only if ``roots`` is not set.
+        """
+        result = self.counts[(session_id, state, True)]
+        if not roots:
+            result += self.counts[(session_id, state, False)]
+
+        return result
@@ -32,8 +32,11 @@ import tempfile
 import ipaddress
 import gettext
 import signal
+import threading
+import collections
+import concurrent.futures
 import dateutil.tz
-from freenas.utils.query import get, set
+from freenas.utils.query import get, set, query
 from datetime import timedelta, datetime
 
 
@@ -70,6 +73,46 @@ def SIGTSTP_setter(set_flag=False):
         signal.signal(signal.SIGTSTP, signal.SIG_DFL)
 
 
+def run_parallel(fn, items, workers, stop=None):
+    """
+    Calls fn for every item from a pool of worker threads, with at most
+    `workers` calls running at once, and yields (index, item, result, error)
+    tuples as the calls complete. No more items are taken from the iterable
+    once the `stop` event is set.
+    """
+    stop = stop or threading.Event()
+    items = enumerate(items)
+    running = {}
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    interrupted = True
+
+    try:
+        while True:
+            while not stop.is_set() and len(running) < workers:
+                try:
+                    idx, item = next(items)
+                except StopIteration:
+                    break
+
+                running[pool.submit(fn, item)] = (idx, item)
+
+            if not running:
+                break
+
+            done, __ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                idx, item = running.pop(f)
+                error = f.exception()
+                yield idx, item, None if error else f.result(), error
+
+        interrupted = False
+    finally:
+        stop.set()
+        # Calls which are already running cannot be cancelled, so do not
+        # wait for them when interrupted
+        pool.shutdown(wait=not interrupted)
+
+
 def parse_query_args(args, kwargs):
     filters = []
     params = {}
@@ -244,13 +287,93 @@ def parse_timedelta(s):
     return delta
 
 
+class EntityIndex(object):
+    """
+    Hash index of entity subscriber items on a single field. Built once
+    from the subscriber contents and then kept up to date from its
+    add/update/delete events.
+    """
+    def __init__(self, subscriber, field):
+        self.subscriber = subscriber
+        self.field = field
+        self.ids = collections.OrderedDict()
+        self.lock = threading.Lock()
+        subscriber.on_add.add(self.add)
+        subscriber.on_update.add(self.update)
+        subscriber.on_delete.add(self.remove)
+
+        for i in list(subscriber.items.values()):
+            self.add(i)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.ids.keys()))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, entity):
+        value = get(entity, self.field)
+        if not isinstance(value, collections.Hashable):
+            return
+
+        with self.lock:
+            self.ids.setdefault(value, collections.OrderedDict())[entity['id']] = True
+
+    def update(self, old_entity, new_entity):
+        self.remove(old_entity)
+        self.add(new_entity)
+
+    def remove(self, entity):
+        value = get(entity, self.field)
+        if not isinstance(value, collections.Hashable):
+            return
+
+        with self.lock:
+            ids = self.ids.get(value)
+            if ids is not None:
+                ids.pop(entity['id'], None)
+                if not ids:
+                    del self.ids[value]
+
+    def query(self, value, *filter):
+        if not isinstance(value, collections.Hashable):
+            return
+
+        with self.lock:
+            ids = list(self.ids.get(value, ()))
+
+        for id in ids:
+            entity = self.subscriber.items.get(id)
+            # Entities updated in place may be left under a stale value
+            if entity is None or get(entity, self.field) != value:
+                continue
+
+            if filter and not query([entity], *filter, single=True):
+                continue
+
+            yield entity
+
+    def get(self, value, *filter):
+        return next(self.query(value, *filter), None)
+
+
+def get_entity(context, subscriber, field, value):
+    if field == 'id':
+        subscriber = context.entity_subscribers[subscriber]
+        subscriber.wait_ready()
+        return subscriber.items.get(value) if isinstance(value, collections.Hashable) else None
+
+    return context.entity_subscribers.index(subscriber, field).get(value)
+
+
 def objname2id(context, subscriber, name):
-    entity = context.entity_subscribers[subscriber].query(('name', '=', name), single=True)
+    entity = get_entity(context, subscriber, 'name', name)
     return entity['id'] if entity else None
 
 
 def objid2name(context, subscriber, id):
-    entity = context.entity_subscribers[subscriber].query(('id', '=', id), single=True)
+    entity = get_entity(context, subscriber, 'id', id)
     return entity['name'] if entity else None
 
 
@@ -262,7 +385,7 @@ def get_localtime_offset():
 
 def get_related(context, name, obj, field):
     id = get(obj, field)
-    thing = context.entity_subscribers[name].query(('id', '=', id), single=True)
+    thing = get_entity(context, name, 'id', id)
     if not thing:
         return None
 
@@ -270,7 +393,7 @@ def get_related(context, name, obj, field):
 
 
 def set_related(context, name, obj, field, value):
-    thing = context.entity_subscribers[name].query(('name', '=', value), single=True)
+    thing = get_entity(context, name, 'name', value)
     if not thing:
         from freenas.cli.namespace import CommandException
         raise CommandException('{0} not found'.format(value))